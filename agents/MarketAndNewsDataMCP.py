@@ -5,21 +5,33 @@ import asyncio
 import aiohttp
 import json
 import logging
-from typing import Dict, List, Optional, Any
-from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Any, Awaitable, Callable
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 import time
 import hashlib
+import re
+import random
+import threading
+import concurrent.futures
+import functools
+from collections import OrderedDict
+from urllib.parse import urlparse
 import numpy as np
 from textblob import TextBlob
+from textblob import _text
+from textblob.en import sentiment as pattern_sentiment
 import feedparser
 from dotenv import load_dotenv
 import tweepy
 import praw
+import prawcore
 
 load_dotenv()
 
 
 COINGECKO_API_URL = "https://api.coingecko.com/api/v3"
+MARKETS_PAGE_SIZE = 250  # CoinGecko /coins/markets per_page maximum
 CG_API_KEY = os.getenv("CG_API_KEY")
 NEWS_API_KEY = os.getenv("NEWS_API_KEY")
 TWITTER_BEARER_TOKEN = os.getenv("TWITTER_BEARER_TOKEN")
@@ -31,10 +43,451 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 CACHE_DURATION = 300  # 5 minutes cache
+CACHE_STALE_DURATION = 600  # serve expired entries for up to 10 more minutes while refreshing
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", 32 * 1024 * 1024))
+CACHE_REFRESH_DRAIN_TIMEOUT = float(os.getenv("CACHE_REFRESH_DRAIN_TIMEOUT", 5))  # seconds close() waits for background refreshes
+
+# Per-endpoint TTLs (seconds), matched against the request URL. Anything not
+# listed here falls back to CACHE_DURATION.
+ENDPOINT_CACHE_DURATIONS = {
+    "/coins/markets": 60,
+    "/global": 900,
+    "/search/trending": 900,
+    "api.alternative.me/fng": 3600,
+}
 
-cache = {}
 last_request_time = {}
 
+HTTP_TIMEOUT_TOTAL = float(os.getenv("HTTP_TIMEOUT_TOTAL", 30))
+HTTP_TIMEOUT_CONNECT = float(os.getenv("HTTP_TIMEOUT_CONNECT", 10))
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", 100))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", 10))
+HTTP_KEEPALIVE_TIMEOUT = 30
+HTTP_DNS_CACHE_TTL = 300
+
+
+class HTTPSessionManager():
+    """Shared, connection-pooled aiohttp sessions.
+
+    aiohttp sessions are bound to the event loop that created them, and every
+    agent job runs in its own `asyncio.run` loop, so one keep-alive session is
+    kept per running loop and reused by every MarketData/NewsAndSocialMediaData
+    instance on that loop.
+    """
+
+    def __init__(self, limit: int = HTTP_POOL_LIMIT, limit_per_host: int = HTTP_POOL_LIMIT_PER_HOST,
+                 total_timeout: float = HTTP_TIMEOUT_TOTAL, connect_timeout: float = HTTP_TIMEOUT_CONNECT,
+                 keepalive_timeout: float = HTTP_KEEPALIVE_TIMEOUT, dns_cache_ttl: int = HTTP_DNS_CACHE_TTL):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, connect=connect_timeout)
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Return the pooled session for the running event loop, creating it on first use"""
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            self._prune()
+            session = self.sessions.get(loop)
+            if session is None or session.closed:
+                connector = aiohttp.TCPConnector(
+                    limit=self.limit,
+                    limit_per_host=self.limit_per_host,
+                    ttl_dns_cache=self.dns_cache_ttl,
+                    keepalive_timeout=self.keepalive_timeout
+                )
+                session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+                self.sessions[loop] = session
+            return session
+
+    async def close(self) -> None:
+        """Close the session bound to the running event loop"""
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            session = self.sessions.pop(loop, None)
+        if session is not None and not session.closed:
+            await session.close()
+
+    def _prune(self) -> None:
+        # Sessions whose loop was closed without calling close() can no longer
+        # be awaited; detach them so the dead loop can be garbage collected.
+        for loop in [l for l in self.sessions if l.is_closed()]:
+            self.sessions.pop(loop).detach()
+
+
+http_sessions = HTTPSessionManager()
+
+HOST_CONCURRENCY_DEFAULT = int(os.getenv("HOST_CONCURRENCY_DEFAULT", 4))
+
+# Maximum in-flight requests per upstream host when agents fan out concurrently.
+HOST_CONCURRENCY_LIMITS = {
+    "api.coingecko.com": int(os.getenv("COINGECKO_CONCURRENCY", 3)),
+    "newsapi.org": int(os.getenv("NEWSAPI_CONCURRENCY", 2)),
+    "api.alternative.me": 2,
+}
+
+
+class HostConcurrencyLimiter():
+    """Per-host semaphores bounding concurrent requests to each upstream API"""
+
+    def __init__(self, default_limit: int = HOST_CONCURRENCY_DEFAULT, limits: Optional[Dict[str, int]] = None):
+        self.default_limit = default_limit
+        self.limits = limits if limits is not None else HOST_CONCURRENCY_LIMITS
+        self.semaphores = {}
+        self.lock = threading.Lock()
+
+    def limit_for(self, host: str) -> int:
+        return self.limits.get(host, self.default_limit)
+
+    def semaphore(self, url: str) -> asyncio.Semaphore:
+        """Return the semaphore for the URL's host on the running event loop"""
+        loop = asyncio.get_running_loop()
+        host = urlparse(url).netloc
+        with self.lock:
+            for key in [k for k in self.semaphores if k[0].is_closed()]:
+                del self.semaphores[key]
+            sem = self.semaphores.get((loop, host))
+            if sem is None:
+                sem = asyncio.Semaphore(self.limit_for(host))
+                self.semaphores[(loop, host)] = sem
+            return sem
+
+
+host_limits = HostConcurrencyLimiter()
+
+
+# Sustained request budget per host as (requests per minute, burst). The
+# CoinGecko demo tier allows 30 calls/minute.
+HOST_RATE_LIMITS = {
+    "api.coingecko.com": (int(os.getenv("COINGECKO_RATE_LIMIT", 30)), 5),
+    "newsapi.org": (int(os.getenv("NEWSAPI_RATE_LIMIT", 30)), 5),
+    "api.alternative.me": (60, 5),
+}
+HOST_RATE_LIMIT_DEFAULT = (120, 10)
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", 4))
+HTTP_BACKOFF_BASE = 1.0
+HTTP_BACKOFF_MAX = 60.0
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RateLimiter():
+    """Per-host token buckets shared by every thread and event loop.
+
+    Callers are queued (they sleep until their slot) rather than failed. A 429
+    with Retry-After blocks the whole host until the server says it is safe.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, tuple]] = None, default_limit: tuple = HOST_RATE_LIMIT_DEFAULT):
+        self.limits = limits if limits is not None else HOST_RATE_LIMITS
+        self.default_limit = default_limit
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def _host(self, host: str) -> Dict[str, Any]:
+        state = self.hosts.get(host)
+        if state is None:
+            per_minute, burst = self.limits.get(host, self.default_limit)
+            state = {
+                "interval": 60.0 / per_minute,
+                "burst": burst,
+                "tat": 0.0,  # theoretical arrival time of the next request (GCRA)
+                "blocked_until": 0.0,
+                "queue_depth": 0,
+                "requests": 0,
+                "throttled": 0,
+                "retries": 0,
+                "total_wait": 0.0,
+                "max_wait": 0.0,
+            }
+            self.hosts[host] = state
+        return state
+
+    async def acquire(self, url: str) -> float:
+        """Wait for a request slot on the URL's host; returns the time spent queued"""
+        host = urlparse(url).netloc
+        start = time.monotonic()
+        with self.lock:
+            state = self._host(host)
+            state["queue_depth"] += 1
+            now = time.monotonic()
+            tat = max(state["tat"], now, state["blocked_until"])
+            send_at = max(tat - (state["burst"] - 1) * state["interval"], now, state["blocked_until"])
+            state["tat"] = tat + state["interval"]
+        try:
+            await asyncio.sleep(send_at - start)
+            # A 429 may have arrived while we were queued
+            while True:
+                with self.lock:
+                    delay = state["blocked_until"] - time.monotonic()
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+        finally:
+            waited = time.monotonic() - start
+            with self.lock:
+                state["queue_depth"] -= 1
+                state["requests"] += 1
+                state["total_wait"] += waited
+                state["max_wait"] = max(state["max_wait"], waited)
+        return waited
+
+    def block(self, url: str, seconds: float) -> None:
+        """Hold back every request to the URL's host for `seconds` (Retry-After)"""
+        host = urlparse(url).netloc
+        with self.lock:
+            state = self._host(host)
+            state["throttled"] += 1
+            state["blocked_until"] = max(state["blocked_until"], time.monotonic() + seconds)
+            state["tat"] = max(state["tat"], state["blocked_until"])
+
+    def record_retry(self, url: str) -> None:
+        with self.lock:
+            self._host(urlparse(url).netloc)["retries"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self.lock:
+            return {
+                host: {
+                    "requests_per_minute": 60.0 / state["interval"],
+                    "queue_depth": state["queue_depth"],
+                    "requests": state["requests"],
+                    "throttled": state["throttled"],
+                    "retries": state["retries"],
+                    "avg_wait": state["total_wait"] / state["requests"] if state["requests"] else 0.0,
+                    "max_wait": state["max_wait"],
+                    "blocked_for": max(0.0, state["blocked_until"] - now),
+                }
+                for host, state in self.hosts.items()
+            }
+
+
+rate_limiter = RateLimiter()
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given either as seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff"""
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+
+class SingleFlight():
+    """Coalesce concurrent identical requests into a single upstream call.
+
+    The first caller for a key runs the request; every caller that arrives while
+    it is in flight, from any thread or event loop, awaits the same result.
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = concurrent.futures.Future()
+                self.calls[key] = future
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            # Shield so a cancelled follower does not cancel the shared future
+            return await asyncio.shield(asyncio.wrap_future(future))
+
+        try:
+            result = await fn()
+        except BaseException as e:
+            with self.lock:
+                self.calls.pop(key, None)
+            future.set_exception(e if isinstance(e, Exception) else Exception(f"Request for {key} was cancelled"))
+            raise
+        with self.lock:
+            self.calls.pop(key, None)
+        future.set_result(result)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "in_flight": len(self.calls),
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+            }
+
+
+single_flight = SingleFlight()
+
+
+async def fetch_json(endpoint: str, params: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> Any:
+    """GET a JSON endpoint through the pooled session.
+
+    Requests are paced by the per-host rate limiter and bounded by the per-host
+    concurrency limit; 429s and transient errors are retried with backoff.
+    """
+    session = await http_sessions.get_session()
+    for attempt in range(HTTP_MAX_RETRIES + 1):
+        await rate_limiter.acquire(endpoint)
+        try:
+            async with host_limits.semaphore(endpoint):
+                async with session.get(endpoint, params=params, headers=headers) as response:
+                    if response.status in RETRYABLE_STATUSES and attempt < HTTP_MAX_RETRIES:
+                        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                        delay = retry_after if retry_after is not None else backoff_delay(attempt)
+                        if response.status == 429:
+                            rate_limiter.block(endpoint, delay)
+                        logger.warning(f"{endpoint} returned {response.status}, retrying in {delay:.1f}s")
+                    else:
+                        response.raise_for_status()
+                        data = await response.json()
+                        logger.debug(f"API request to {endpoint} successful")
+                        return data
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            if attempt >= HTTP_MAX_RETRIES:
+                raise
+            delay = backoff_delay(attempt)
+            logger.warning(f"{endpoint} failed ({e!r}), retrying in {delay:.1f}s")
+        rate_limiter.record_retry(endpoint)
+        await asyncio.sleep(delay)
+
+
+class ResponseCache():
+    """Bounded TTL + LRU cache for API responses with stale-while-revalidate"""
+
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES, default_ttl: int = CACHE_DURATION,
+                 stale_ttl: int = CACHE_STALE_DURATION, endpoint_ttls: Optional[Dict[str, int]] = None):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.stale_ttl = stale_ttl
+        self.endpoint_ttls = endpoint_ttls if endpoint_ttls is not None else ENDPOINT_CACHE_DURATIONS
+        self.entries = OrderedDict()
+        self.current_bytes = 0
+        self.refreshing = set()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def ttl_for(self, endpoint: str) -> int:
+        """Return the TTL configured for an endpoint"""
+        for pattern, ttl in self.endpoint_ttls.items():
+            if pattern in endpoint:
+                return ttl
+        return self.default_ttl
+
+    def __contains__(self, cache_key: str) -> bool:
+        with self.lock:
+            return cache_key in self.entries
+
+    def __getitem__(self, cache_key: str) -> Dict[str, Any]:
+        with self.lock:
+            return self.entries[cache_key]
+
+    def lookup(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Return the entry for a key (marking it recently used) or None on a miss.
+
+        Expired entries are still returned while they are inside the stale window;
+        the caller decides whether to revalidate them using `entry['fresh']`.
+        """
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(cache_key)
+            if entry is None or now - entry['timestamp'] >= entry['ttl'] + self.stale_ttl:
+                if entry is not None:
+                    self._remove(cache_key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(cache_key)
+            fresh = now - entry['timestamp'] < entry['ttl']
+            if fresh:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+            return {"data": entry['data'], "fresh": fresh}
+
+    def store(self, cache_key: str, endpoint: str, data: Any) -> None:
+        """Insert or replace an entry, evicting least recently used entries over the memory cap"""
+        try:
+            size = len(json.dumps(data, default=str))
+        except (TypeError, ValueError):
+            size = 0
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if cache_key in self.entries:
+                self._remove(cache_key)
+            self.entries[cache_key] = {
+                "data": data,
+                "timestamp": time.time(),
+                "ttl": self.ttl_for(endpoint),
+                "size": size,
+            }
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes and self.entries:
+                oldest_key = next(iter(self.entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def start_refresh(self, cache_key: str) -> bool:
+        """Claim the background refresh for a key; False if one is already running"""
+        with self.lock:
+            if cache_key in self.refreshing:
+                return False
+            self.refreshing.add(cache_key)
+            return True
+
+    def end_refresh(self, cache_key: str) -> None:
+        with self.lock:
+            self.refreshing.discard(cache_key)
+
+    def _remove(self, cache_key: str) -> None:
+        entry = self.entries.pop(cache_key)
+        self.current_bytes -= entry['size']
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counters for monitoring the hit ratio"""
+        with self.lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "refreshing": len(self.refreshing),
+                "hit_ratio": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            }
+
+
+cache = ResponseCache()
+
     
 def get_cache_key(endpoint: str, params: Dict[str, Any]) -> str:
     """Generate cache key for request"""
@@ -46,37 +499,841 @@ def is_cache_valid(cache_key: str) -> bool:
     if cache_key not in cache:
         return False
 
-    cached_time = cache[cache_key].get('timestamp', 0)
-    return time.time() - cached_time < CACHE_DURATION
+    entry = cache[cache_key]
+    return time.time() - entry.get('timestamp', 0) < entry.get('ttl', CACHE_DURATION)
+
+
+SOCIAL_MAX_WORKERS = int(os.getenv("SOCIAL_MAX_WORKERS", 8))
+
+# Per-source timeouts (seconds) for the blocking social/RSS clients
+SOURCE_TIMEOUTS = {
+    "twitter": float(os.getenv("TWITTER_TIMEOUT", 15)),
+    "reddit": float(os.getenv("REDDIT_TIMEOUT", 15)),
+    "rss": float(os.getenv("RSS_TIMEOUT", 10)),
+}
+
+social_executor = concurrent.futures.ThreadPoolExecutor(max_workers=SOCIAL_MAX_WORKERS, thread_name_prefix="social")
+
+
+async def run_blocking(source: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a synchronous client call (tweepy, praw, feedparser) on the social thread pool.
+
+    Raises asyncio.TimeoutError after the source's timeout. The worker thread
+    cannot be interrupted and finishes in the background, but the caller moves on.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(social_executor, functools.partial(fn, *args, **kwargs))
+    return await asyncio.wait_for(future, timeout=SOURCE_TIMEOUTS.get(source))
+
+
+class SocialClients():
+    """Process-wide, lazily created Twitter and Reddit clients.
+
+    The Twitter client is built once and shared by every
+    NewsAndSocialMediaData instance. praw is not thread-safe, so each social
+    worker thread builds its own Reddit client on first use and keeps it
+    (with its OAuth token and requests session) for later calls; Reddit
+    searches for different tokens run in parallel without a shared lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()  # per-thread praw client
+        self.reddit_clients = 0
+        self._twitter = None
+        self.twitter_retry_at = 0.0  # after a 429, Twitter is skipped until its rate-limit window resets
+        self.metrics = {
+            source: {"requests": 0, "errors": 0, "auth_refreshes": 0, "rate_limited": 0, "total_latency": 0.0, "max_latency": 0.0}
+            for source in ("twitter", "reddit")
+        }
+
+    def twitter(self) -> Optional[tweepy.Client]:
+        if self._twitter is None and TWITTER_BEARER_TOKEN:
+            with self.lock:
+                if self._twitter is None:
+                    try:
+                        self._twitter = tweepy.Client(
+                            bearer_token=TWITTER_BEARER_TOKEN,
+                            wait_on_rate_limit=False
+                        )
+                    except Exception as e:
+                        logger.warning(f"Twitter client initialization failed: {e}")
+        return self._twitter
+
+    def reddit(self) -> praw.Reddit:
+        """The calling thread's praw client"""
+        reddit = getattr(self.local, "reddit", None)
+        if reddit is None:
+            reddit = self.local.reddit = praw.Reddit(
+                client_id=REDDIT_CLIENT_ID,
+                client_secret=REDDIT_CLIENT_SECRET,
+                user_agent=REDDIT_USER_AGENT,
+                requestor_class=InstrumentedRequestor
+            )
+            with self.lock:
+                self.reddit_clients += 1
+        return reddit
+
+    def twitter_rate_limited(self) -> bool:
+        return time.time() < self.twitter_retry_at
+
+    def record_rate_limit(self, response) -> None:
+        """Skip Twitter until the x-rate-limit-reset epoch of a 429 (60s when it is missing)"""
+        try:
+            reset = float(response.headers.get("x-rate-limit-reset"))
+        except (AttributeError, TypeError, ValueError):
+            reset = time.time() + 60
+        with self.lock:
+            self.twitter_retry_at = max(self.twitter_retry_at, reset)
+            self.metrics["twitter"]["rate_limited"] += 1
+
+    def record_auth(self, source: str) -> None:
+        with self.lock:
+            self.metrics[source]["auth_refreshes"] += 1
+
+    def record_request(self, source: str, latency: float, error: bool = False) -> None:
+        with self.lock:
+            metrics = self.metrics[source]
+            metrics["requests"] += 1
+            metrics["errors"] += int(error)
+            metrics["total_latency"] += latency
+            metrics["max_latency"] = max(metrics["max_latency"], latency)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            stats = {
+                source: {
+                    "requests": m["requests"],
+                    "errors": m["errors"],
+                    "auth_refreshes": m["auth_refreshes"],
+                    "rate_limited": m["rate_limited"],
+                    "avg_latency": m["total_latency"] / m["requests"] if m["requests"] else 0.0,
+                    "max_latency": m["max_latency"],
+                }
+                for source, m in self.metrics.items()
+            }
+            stats["reddit"]["clients"] = self.reddit_clients
+            return stats
+
+
+class InstrumentedRequestor(prawcore.Requestor):
+    """prawcore requestor that reports Reddit latency and OAuth token refreshes"""
+
+    def request(self, *args, **kwargs):
+        url = args[1] if len(args) > 1 else kwargs.get("url", "")
+        if "access_token" in str(url):
+            social_clients.record_auth("reddit")
+        start = time.monotonic()
+        error = False
+        try:
+            return super().request(*args, **kwargs)
+        except Exception:
+            error = True
+            raise
+        finally:
+            social_clients.record_request("reddit", time.monotonic() - start, error)
+
+
+social_clients = SocialClients()
+
+
+RSS_FEEDS = [url for url in os.getenv("RSS_FEEDS", ",".join([
+    "https://www.coindesk.com/arc/outboundfeeds/rss/",
+    "https://cointelegraph.com/rss",
+    "https://decrypt.co/feed",
+])).split(",") if url]
+FEED_REFRESH_INTERVAL = int(os.getenv("FEED_REFRESH_INTERVAL", 300))
+FEED_FAILURE_TTL = int(os.getenv("FEED_FAILURE_TTL", 60))  # seconds a failed or timed-out feed is not retried
+
+
+class FeedCache():
+    """Shared RSS feed store with conditional GETs and a word index.
+
+    Each feed is downloaded at most once per refresh window using ETag /
+    If-Modified-Since, parsed once, and indexed by the lowercase words of its
+    titles and summaries, so matching a token is a dictionary lookup. A feed
+    that fails or times out keeps its previous entries and is not retried for
+    `failure_ttl` seconds, so one broken feed costs one attempt per cycle
+    rather than one per token.
+    """
+
+    def __init__(self, feeds: Optional[List[str]] = None, refresh_interval: int = FEED_REFRESH_INTERVAL,
+                 failure_ttl: int = FEED_FAILURE_TTL):
+        self.feeds = {
+            url: {"etag": None, "modified": None, "entries": [], "fetched_at": 0.0, "failed_at": 0.0}
+            for url in (feeds if feeds is not None else RSS_FEEDS)
+        }
+        self.refresh_interval = refresh_interval
+        self.failure_ttl = failure_ttl
+        self.index = {}
+        self.lock = threading.Lock()
+        self.fetches = 0
+        self.not_modified = 0
+        self.failures = 0
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        return re.findall(r"[a-z0-9]+", text.lower())
+
+    def due(self, feed: Dict[str, Any], now: float) -> bool:
+        """Refresh window expired and not inside a recent failure's backoff"""
+        return (now - feed["fetched_at"] >= self.refresh_interval
+                and now - feed["failed_at"] >= self.failure_ttl)
+
+    def record_failure(self, feed: Dict[str, Any]) -> None:
+        with self.lock:
+            feed["failed_at"] = time.time()
+            self.failures += 1
+
+    async def refresh(self) -> None:
+        """Refresh every feed whose window has expired"""
+        now = time.time()
+        stale = [url for url, feed in self.feeds.items() if self.due(feed, now)]
+        if not stale:
+            return
+        changed = await asyncio.gather(*(
+            single_flight.do(f"feed:{url}", functools.partial(self._refresh_feed, url)) for url in stale
+        ))
+        if any(changed):
+            self._rebuild_index()
+
+    async def _refresh_feed(self, url: str) -> bool:
+        with self.lock:
+            feed = self.feeds[url]
+            if not self.due(feed, time.time()):
+                return False
+            etag, modified = feed["etag"], feed["modified"]
+        try:
+            parsed = await run_blocking("rss", feedparser.parse, url, etag=etag, modified=modified)
+        except asyncio.TimeoutError:
+            logger.warning(f"RSS fetch timed out for {url}")
+            self.record_failure(feed)
+            return False
+        except Exception as e:
+            logger.warning(f"RSS fetch failed for {url}: {e}")
+            self.record_failure(feed)
+            return False
+        if parsed.get("bozo") and not parsed.entries and getattr(parsed, "status", None) != 304:
+            logger.warning(f"RSS fetch failed for {url}: {parsed.get('bozo_exception')}")
+            self.record_failure(feed)
+            return False
+
+        with self.lock:
+            self.fetches += 1
+            feed["fetched_at"] = time.time()
+            if getattr(parsed, "status", None) == 304:
+                self.not_modified += 1
+                return False
+            feed["etag"] = getattr(parsed, "etag", None)
+            feed["modified"] = getattr(parsed, "modified", None)
+            feed["entries"] = [
+                {
+                    "title": entry.get("title", ""),
+                    "description": entry.get("summary", ""),
+                    "url": entry.get("link", ""),
+                    "publishedAt": entry.get("published", ""),
+                    "source": url,
+                }
+                for entry in parsed.entries
+            ]
+            return True
+
+    def _rebuild_index(self) -> None:
+        index = {}
+        with self.lock:
+            for feed in self.feeds.values():
+                for entry in feed["entries"]:
+                    words = self.tokenize(f"{entry['title']} {entry['description']}")
+                    entry["_text"] = f" {' '.join(words)} "
+                    for word in set(words):
+                        index.setdefault(word, []).append(entry)
+            self.index = index
+
+    def lookup(self, term: str) -> List[Dict[str, Any]]:
+        """Entries mentioning `term` (a symbol or a possibly multi-word name)"""
+        words = self.tokenize(term)
+        if not words:
+            return []
+        index = self.index
+        candidates = min((index.get(word, []) for word in words), key=len)
+        phrase = f" {' '.join(words)} "
+        return [entry for entry in candidates if len(words) == 1 or phrase in entry["_text"]]
+
+    async def search(self, *terms: str) -> List[Dict[str, Any]]:
+        """Refresh if needed and return the entries matching any of the terms"""
+        await self.refresh()
+        seen = set()
+        articles = []
+        for term in terms:
+            if not term:
+                continue
+            for entry in self.lookup(term):
+                if entry["url"] in seen:
+                    continue
+                seen.add(entry["url"])
+                articles.append({k: v for k, v in entry.items() if not k.startswith("_")})
+        return articles
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "feeds": len(self.feeds),
+                "entries": sum(len(feed["entries"]) for feed in self.feeds.values()),
+                "indexed_words": len(self.index),
+                "fetches": self.fetches,
+                "not_modified": self.not_modified,
+                "failures": self.failures,
+            }
+
+
+feed_cache = FeedCache()
+
+
+class BatchSentimentEngine():
+    """Vectorized, TextBlob-compatible polarity scoring for many texts at once.
+
+    All texts of a batch are tokenized with a single regex pass, mapped onto the
+    pattern lexicon with one sorted-array lookup and scored with NumPy, applying
+    the same rules as TextBlob's PatternAnalyzer: lexicon words are averaged and
+    a modifier ("very", "really") folds into the following known word. Texts
+    that need the rules not reproduced here (negations, exclamation marks,
+    ellipses, emoticons) are scored by TextBlob itself, so results are
+    identical either way.
+    """
+
+    SEPARATOR = "\x00"
+    CHUNK_RE = re.compile(r"[^\s'\"\u201c\u201d\u2018\u2019]+")
+    PUNCTUATION = _text.PUNCTUATION.replace(".", "").replace("'", "").replace('"', "")
+
+    def __init__(self):
+        words = sorted(w for w in pattern_sentiment if " " not in w)
+        self.vocab = np.array(words)
+        self.polarity = np.array([pattern_sentiment[w][None][0] for w in words], dtype=np.float64)
+        self.intensity = np.array([pattern_sentiment[w][None][2] for w in words], dtype=np.float64)
+        self.is_modifier = np.array([
+            any(pos in pattern_sentiment[w] for pos in pattern_sentiment.modifiers) for w in words
+        ])
+        emoticons = sorted({e.lower() for group in _text.EMOTICONS.values() for e in group if not e.isalpha()}, key=len, reverse=True)
+        # find_tokens re-joins emoticons split by spaces (": (" becomes ":("); the
+        # lookahead on their first characters keeps the alternation cheap.
+        emoticon_re = "(?=[%s])(?:%s)" % (
+            "".join(sorted({re.escape(e[0]) for e in emoticons})),
+            "|".join(r"\s*".join(re.escape(c) for c in e) for e in emoticons)
+        )
+        negation_re = r"\b(?:%s)\b" % "|".join(w for w in pattern_sentiment.negations if w.isalpha())
+        self.fallback_re = re.compile("|".join([r"!", r"\.\.\.", r"n't", negation_re, emoticon_re]))
+        self.fast_texts = 0
+        self.fallback_texts = 0
+
+    def needs_fallback(self, text: str) -> bool:
+        return self.fallback_re.search(text.lower()) is not None
+
+    @staticmethod
+    def _is_abbreviation(t: str) -> bool:
+        return (t in _text.ABBREVIATIONS or _text.RE_ABBR1.match(t) is not None
+                or _text.RE_ABBR2.match(t) is not None or _text.RE_ABBR3.match(t) is not None)
+
+    def _strip_trailing(self, t: str) -> str:
+        # Mirrors pattern's find_tokens, which keeps the period of abbreviations
+        punctuation = tuple(self.PUNCTUATION)
+        while t.endswith(punctuation + (".",)):
+            if t.endswith(punctuation):
+                t = t[:-1]
+            if t.endswith("..."):
+                t = t[:-3].rstrip(".")
+            if t.endswith("."):
+                if self._is_abbreviation(t):
+                    break
+                t = t[:-1]
+        return t
+
+    def polarities(self, texts: List[str]) -> np.ndarray:
+        """Polarity (-1..1) for every text, identical to TextBlob(text).sentiment.polarity"""
+        result = np.zeros(len(texts), dtype=np.float64)
+        fast = []
+        for i, text in enumerate(texts):
+            if self.needs_fallback(text):
+                result[i] = TextBlob(text).sentiment.polarity
+            else:
+                fast.append(i)
+        self.fallback_texts += len(texts) - len(fast)
+        self.fast_texts += len(fast)
+        if fast:
+            result[fast] = self._score_fast([texts[i] for i in fast])
+        return result
+
+    def _score_fast(self, texts: List[str]) -> np.ndarray:
+        corpus = f" {self.SEPARATOR} ".join(texts)
+        chunks = np.array(self.CHUNK_RE.findall(corpus) or [""])
+        is_separator = chunks == self.SEPARATOR
+        doc = np.cumsum(is_separator)[~is_separator]
+        chunks = chunks[~is_separator]
+        if chunks.size == 0:
+            return np.zeros(len(texts))
+
+        left = np.char.lstrip(chunks, self.PUNCTUATION)
+        words = np.char.lower(np.char.rstrip(left, self.PUNCTUATION + ".")).astype(left.dtype)
+        # Abbreviations ("Mr.", "Ok.") keep their period, which turns them into
+        # unknown words; only chunks with a trailing period need the exact rule.
+        for k in np.nonzero(np.char.endswith(np.char.rstrip(left, self.PUNCTUATION), "."))[0]:
+            words[k] = self._strip_trailing(str(left[k])).lower()
+        lengths = np.char.str_len(words)
+
+        slot = np.minimum(np.searchsorted(self.vocab, words), len(self.vocab) - 1)
+        known = self.vocab[slot] == words
+        long_unknown = ~known & (lengths > 2)
+        cum_long = np.cumsum(long_unknown)
+
+        known_idx = np.nonzero(known)[0]
+        if known_idx.size == 0:
+            return np.zeros(len(texts))
+        kslot = slot[known_idx]
+        kdoc = doc[known_idx]
+        pol = self.polarity[kslot]
+        prev = np.r_[0, known_idx[:-1]]
+        prev_slot = np.r_[0, kslot[:-1]]
+        # A known word continues the previous assessment when the previous known
+        # word in the same text is a modifier and no unknown word longer than
+        # two characters sits between them.
+        linked = np.r_[False, kdoc[1:] == kdoc[:-1]] & self.is_modifier[prev_slot] & (cum_long[known_idx] == cum_long[prev])
+        values = np.where(linked, np.clip(pol * self.intensity[prev_slot], -1.0, 1.0), pol)
+        chain_end = np.r_[~linked[1:], True]
+
+        sums = np.bincount(kdoc[chain_end], weights=values[chain_end], minlength=len(texts))
+        counts = np.bincount(kdoc[chain_end], minlength=len(texts))
+        return sums / np.maximum(counts, 1)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"fast_texts": self.fast_texts, "fallback_texts": self.fallback_texts}
+
+
+sentiment_engine = BatchSentimentEngine()
+
+
+SENTIMENT_CACHE_SIZE = int(os.getenv("SENTIMENT_CACHE_SIZE", 50000))
+SENTIMENT_CACHE_PATH = os.getenv("SENTIMENT_CACHE_PATH")  # unset = memory only
+
+
+class SentimentCache():
+    """LRU memo of TextBlob polarity keyed by a hash of the text.
+
+    NewsAPI and Reddit return mostly the same texts every cycle, so each text
+    is scored once. When `path` is set the memo is loaded at startup and
+    written back by save().
+    """
+
+    def __init__(self, max_entries: int = SENTIMENT_CACHE_SIZE, path: Optional[str] = SENTIMENT_CACHE_PATH):
+        self.max_entries = max_entries
+        self.path = path
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.dirty = False
+        if path:
+            self.load()
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def polarity(self, text: str) -> float:
+        """TextBlob polarity (-1..1) for a text, scored at most once"""
+        return self.polarities([text])[0]
+
+    def polarities(self, texts: List[str]) -> List[float]:
+        """Polarity for many texts; only unseen texts are scored, in one batch"""
+        keys = [self.key(text) for text in texts]
+        values = [None] * len(texts)
+        missing = []
+        with self.lock:
+            for i, key in enumerate(keys):
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    values[i] = self.entries[key]
+                    self.hits += 1
+                else:
+                    missing.append(i)
+            self.misses += len(missing)
+        if missing:
+            scores = sentiment_engine.polarities([texts[i] for i in missing])
+            for i, score in zip(missing, scores):
+                values[i] = float(score)
+                self.store(keys[i], values[i])
+        return values
+
+    def store(self, key: str, value: float) -> None:
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            self.dirty = True
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def load(self) -> None:
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load sentiment cache from {self.path}: {e}")
+            return
+        with self.lock:
+            for key, value in list(data.items())[-self.max_entries:]:
+                self.entries[key] = value
+
+    def save(self) -> None:
+        """Persist the memo to disk (atomic replace) if it changed"""
+        if not self.path:
+            return
+        with self.lock:
+            if not self.dirty:
+                return
+            data = dict(self.entries)
+            self.dirty = False
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save sentiment cache to {self.path}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+sentiment_cache = SentimentCache()
+
+
+PRICE_HISTORY_SIZE = int(os.getenv("PRICE_HISTORY_SIZE", 2880))  # points kept per token
+
+
+class PriceRing():
+    """Fixed-size float64 ring of (timestamp, price, return) for one token.
 
+    Every value is written twice, at i and i + capacity, so the last n points
+    are always one contiguous slice and window() returns read-only views
+    without copying. Memory is fixed at 3 * 2 * capacity * 8 bytes.
+    """
 
+    FIELDS = ("timestamps", "prices", "returns")
+
+    def __init__(self, capacity: int = PRICE_HISTORY_SIZE):
+        self.capacity = capacity
+        self.buffer = np.zeros((len(self.FIELDS), 2 * capacity), dtype=np.float64)
+        self.head = 0      # next write slot in [0, capacity)
+        self.size = 0
+        self.total = 0     # points ever appended
+
+    @property
+    def nbytes(self) -> int:
+        return self.buffer.nbytes
+
+    def last(self, field: str = "prices") -> Optional[float]:
+        if not self.size:
+            return None
+        return float(self.buffer[self.FIELDS.index(field), self.head + self.capacity - 1])
+
+    def append(self, timestamp: float, price: float) -> None:
+        previous = self.last()
+        ret = price / previous - 1 if previous else np.nan
+        slot = self.head
+        self.buffer[:, slot] = self.buffer[:, slot + self.capacity] = (timestamp, price, ret)
+        self.head = (slot + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        self.total += 1
+
+    def window(self, field: str = "prices", n: Optional[int] = None) -> np.ndarray:
+        """Read-only view of the last n values of a field, oldest first"""
+        n = self.size if n is None else max(0, min(n, self.size))
+        end = self.head + self.capacity
+        view = self.buffer[self.FIELDS.index(field), end - n:end]
+        view.flags.writeable = False
+        return view
+
+
+class PriceHistory():
+    """Per-token PriceRing store filled from each market data poll.
+
+    Points are keyed on CoinGecko's last_updated, so a cached or repeated
+    response does not record the same price twice.
+    """
+
+    def __init__(self, capacity: int = PRICE_HISTORY_SIZE):
+        self.capacity = capacity
+        self.rings: Dict[str, PriceRing] = {}
+        self.lock = threading.Lock()
+        self.recorded = 0
+        self.duplicates = 0
+
+    @staticmethod
+    def timestamp(value: Optional[str]) -> float:
+        if not value:
+            return time.time()
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            return time.time()
+
+    def record(self, tokens: List[Dict[str, Any]]) -> None:
+        with self.lock:
+            for token in tokens:
+                price = token.get("price")
+                if not token.get("id") or not price:
+                    continue
+                ring = self.rings.get(token["id"])
+                if ring is None:
+                    ring = self.rings[token["id"]] = PriceRing(self.capacity)
+                timestamp = self.timestamp(token.get("last_updated"))
+                if ring.size and timestamp <= ring.last("timestamps"):
+                    self.duplicates += 1
+                    continue
+                ring.append(timestamp, float(price))
+                self.recorded += 1
+
+    def ring(self, token_id: str) -> Optional[PriceRing]:
+        return self.rings.get(token_id)
+
+    def prices(self, token_id: str, n: Optional[int] = None) -> np.ndarray:
+        ring = self.rings.get(token_id)
+        return ring.window("prices", n) if ring else np.empty(0)
+
+    def returns(self, token_id: str, n: Optional[int] = None) -> np.ndarray:
+        """Simple returns between consecutive points (the first point has none)"""
+        ring = self.rings.get(token_id)
+        if not ring:
+            return np.empty(0)
+        n = ring.size - 1 if n is None else min(n, ring.size - 1)
+        return ring.window("returns", n)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "tokens": len(self.rings),
+                "capacity": self.capacity,
+                "points": {token_id: ring.size for token_id, ring in self.rings.items()},
+                "recorded": self.recorded,
+                "duplicates": self.duplicates,
+                "bytes": sum(ring.nbytes for ring in self.rings.values())
+            }
+
+
+price_history = PriceHistory()
+
+
+MARKET_HISTORY_PATH = os.getenv("MARKET_HISTORY_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "market_history"))  # empty = disabled
+MARKET_HISTORY_GROWTH = 65536  # rows added to a token's files each time they fill up
+
+
+class ColumnarHistory():
+    """Append-only on-disk columns for one token, one np.memmap per field.
+
+    Files are preallocated in MARKET_HISTORY_GROWTH-row chunks and the row
+    count lives in its own 8-byte file written after the data, so opening a
+    token only maps the files: no scan, whatever the history length. The
+    timestamp column is strictly increasing and doubles as the index.
+    """
+
+    FIELDS = ("timestamp", "price", "total_volume", "market_cap")
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        count_path = os.path.join(directory, "count.i64")
+        if not os.path.exists(count_path):
+            np.zeros(1, dtype=np.int64).tofile(count_path)
+        self.count_file = np.memmap(count_path, dtype=np.int64, mode="r+", shape=(1,))
+        self.count = int(self.count_file[0])
+        self.capacity = 0
+        self.columns: Dict[str, np.memmap] = {}
+        self.map(max(self.count, MARKET_HISTORY_GROWTH))
+
+    def path(self, field: str) -> str:
+        return os.path.join(self.directory, f"{field}.f64")
+
+    def map(self, capacity: int) -> None:
+        for field in self.FIELDS:
+            with open(self.path(field), "ab") as f:
+                if f.tell() < capacity * 8:
+                    f.truncate(capacity * 8)
+            self.columns[field] = np.memmap(self.path(field), dtype=np.float64, mode="r+", shape=(capacity,))
+        self.capacity = capacity
+
+    def last_timestamp(self) -> Optional[float]:
+        return float(self.columns["timestamp"][self.count - 1]) if self.count else None
+
+    def append(self, row: Dict[str, float]) -> bool:
+        last = self.last_timestamp()
+        if last is not None and row["timestamp"] <= last:
+            return False
+        if self.count == self.capacity:
+            self.map(self.capacity + MARKET_HISTORY_GROWTH)
+        for field in self.FIELDS:
+            self.columns[field][self.count] = row.get(field) or 0.0
+        self.count += 1
+        self.count_file[0] = self.count
+        return True
+
+    def range(self, start: Optional[float] = None, end: Optional[float] = None) -> Dict[str, np.ndarray]:
+        """Read-only views of every field for start <= timestamp < end"""
+        timestamps = self.columns["timestamp"][:self.count]
+        lo = 0 if start is None else int(np.searchsorted(timestamps, start, side="left"))
+        hi = self.count if end is None else int(np.searchsorted(timestamps, end, side="left"))
+        result = {}
+        for field in self.FIELDS:
+            view = self.columns[field][lo:hi].view(np.ndarray)
+            view.flags.writeable = False
+            result[field] = view
+        return result
+
+    def flush(self) -> None:
+        for column in self.columns.values():
+            column.flush()
+        self.count_file.flush()
+
+
+class MarketHistoryStore():
+    """Long-horizon per-token market history on disk, appended on every poll.
+
+    Tokens are opened lazily on first use, so startup cost does not depend
+    on how much history is stored.
+    """
+
+    def __init__(self, path: Optional[str] = MARKET_HISTORY_PATH):
+        self.path = path
+        self.tokens: Dict[str, ColumnarHistory] = {}
+        self.lock = threading.Lock()
+        self.appended = 0
+        self.duplicates = 0
+
+    @staticmethod
+    def to_timestamp(value) -> Optional[float]:
+        if value is None or isinstance(value, (int, float)):
+            return value
+        return value.timestamp()
+
+    def history(self, token_id: str, create: bool = False) -> Optional[ColumnarHistory]:
+        history = self.tokens.get(token_id)
+        if history is None:
+            directory = os.path.join(self.path, re.sub(r"[^A-Za-z0-9_.-]", "_", token_id))
+            if not create and not os.path.isdir(directory):
+                return None
+            history = self.tokens[token_id] = ColumnarHistory(directory)
+        return history
+
+    def append(self, tokens: List[Dict[str, Any]]) -> None:
+        if not self.path:
+            return
+        with self.lock:
+            for token in tokens:
+                if not token.get("id") or not token.get("price"):
+                    continue
+                row = {
+                    "timestamp": PriceHistory.timestamp(token.get("last_updated")),
+                    "price": float(token["price"]),
+                    "total_volume": float(token.get("total_volume") or 0.0),
+                    "market_cap": float(token.get("market_cap") or 0.0)
+                }
+                if self.history(token["id"], create=True).append(row):
+                    self.appended += 1
+                else:
+                    self.duplicates += 1
+
+    def range(self, token_id: str, start=None, end=None) -> Dict[str, np.ndarray]:
+        """Zero-copy arrays of a token's history; start/end are datetimes or epoch seconds"""
+        if not self.path:
+            return {field: np.empty(0) for field in ColumnarHistory.FIELDS}
+        with self.lock:
+            history = self.history(token_id)
+            if history is None:
+                return {field: np.empty(0) for field in ColumnarHistory.FIELDS}
+            return history.range(self.to_timestamp(start), self.to_timestamp(end))
+
+    def flush(self) -> None:
+        with self.lock:
+            for history in self.tokens.values():
+                history.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "path": self.path,
+                "open_tokens": len(self.tokens),
+                "rows": {token_id: history.count for token_id, history in self.tokens.items()},
+                "appended": self.appended,
+                "duplicates": self.duplicates
+            }
+
+
+market_history = MarketHistoryStore()
 
 class MarketData():
     def __init__(self):
         self.session = None
+        self.refresh_tasks = set()  # background stale-while-revalidate refreshes, drained by close()
 
     async def _make_request(self, endpoint: str, params: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
-        """Make HTTP request with optional headers"""
+        """Make HTTP request with optional headers, served from the response cache when possible"""
         try:
            
             logger.info(f"#### API request to {endpoint} - {headers} - {params}" )
 
             cache_key = get_cache_key(endpoint, params)
-        
-            if is_cache_valid(cache_key):
-                logger.debug(f"Cache hit for {endpoint}")
-                return cache[cache_key]['data']
-
-            async with aiohttp.ClientSession() as session:
-                async with session.get(endpoint, params=params, headers=headers) as response:
-                    response.raise_for_status()
-                    data = await response.json()
-                    logger.debug(f"API request to {endpoint} successful")
-                    return data
+            cached = cache.lookup(cache_key)
+            if cached is not None:
+                if cached['fresh']:
+                    logger.debug(f"Cache hit for {endpoint}")
+                elif cache.start_refresh(cache_key):
+                    logger.debug(f"Serving stale cache for {endpoint}, refreshing in background")
+                    task = asyncio.ensure_future(self._refresh(cache_key, endpoint, params, headers))
+                    self.refresh_tasks.add(task)
+                    task.add_done_callback(self.refresh_tasks.discard)
+                return cached['data']
+
+            data = await self._fetch(endpoint, params, headers)
+            cache.store(cache_key, endpoint, data)
+            return data
         except Exception as e:
             logger.error(f"API request failed for {endpoint}: {e}")
             raise Exception(f"API request failed: {e}")
 
+    async def _fetch(self, endpoint: str, params: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> Any:
+        cache_key = get_cache_key(endpoint, params)
+        return await single_flight.do(cache_key, lambda: fetch_json(endpoint, params, headers))
+
+    async def _refresh(self, cache_key: str, endpoint: str, params: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        """Revalidate a stale cache entry in the background"""
+        try:
+            data = await self._fetch(endpoint, params, headers)
+            cache.store(cache_key, endpoint, data)
+        except Exception as e:
+            logger.warning(f"Background refresh failed for {endpoint}: {e}")
+        finally:
+            cache.end_refresh(cache_key)
+
+    async def close(self) -> None:
+        """Finish or cancel background refreshes, then release the pooled HTTP session and flush the on-disk history"""
+        if self.refresh_tasks:
+            _, pending = await asyncio.wait(set(self.refresh_tasks), timeout=CACHE_REFRESH_DRAIN_TIMEOUT)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        await http_sessions.close()
+        await asyncio.get_running_loop().run_in_executor(None, market_history.flush)
+
     async def get_market_data(self, params: Dict[str, Any]) -> Dict[str, Any]:
         """Get comprehensive market data"""
         try:
@@ -111,8 +1368,11 @@ class MarketData():
                     "market_cap_rank": coin.get("market_cap_rank", 0),
                     "circulating_supply": coin.get("circulating_supply", 0),
                     "total_supply": coin.get("total_supply", 0),
+                    "last_updated": coin.get("last_updated"),
                 }
                 tokens.append(token)
+            price_history.record(tokens)
+            market_history.append(tokens)
 
             global_endpoint = f"{COINGECKO_API_URL}/global"
             #headers = {"x-cg-demo-api-key": CG_API_KEY} if CG_API_KEY else None
@@ -167,27 +1427,119 @@ class MarketData():
                 "total_supply": market_data.get("total_supply", 0),
                 "max_supply": market_data.get("max_supply", 0),
                 "market_cap_rank": market_data.get("market_cap_rank", 0),
-                "sentiment_votes_up_percentage": data.get("sentiment_votes_up_percentage", 0),
-                "sentiment_votes_down_percentage": data.get("sentiment_votes_down_percentage", 0),
-                "community_score": data.get("community_score", 0),
-                "developer_score": data.get("developer_score", 0),
-                "liquidity_score": data.get("liquidity_score", 0),
-                "public_interest_score": data.get("public_interest_score", 0),
-                "links": {
-                    "homepage": data.get("links", {}).get("homepage", []),
-                    "blockchain_site": data.get("links", {}).get("blockchain_site", []),
-                    "official_forum_url": data.get("links", {}).get("official_forum_url", []),
-                    "chat_url": data.get("links", {}).get("chat_url", []),
-                    "twitter_screen_name": data.get("links", {}).get("twitter_screen_name", ""),
-                    "telegram_channel_identifier": data.get("links", {}).get("telegram_channel_identifier", ""),
-                    "subreddit_url": data.get("links", {}).get("subreddit_url", "")
-                }
             }
+            token_data.update(self.token_details_from_coin(data))
             return {"success": True, "data": token_data}
         except Exception as e:
             logger.error(f"Token data request failed: {e}")
             return {"success": False, "error": str(e)}
 
+    async def get_tokens_data(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Get detailed data for many tokens from bulk /coins/markets pages.
+
+        Returns the same per-token fields as get_token_data, keyed by coin id.
+        The bulk endpoint has no community/developer scores or links; those are
+        only fetched from /coins/{id} when `details` is set.
+        """
+        try:
+            ids = params.get("ids", [])
+            if isinstance(ids, str):
+                ids = [i for i in ids.split(",") if i]
+            per_page = min(params.get("per_page", MARKETS_PAGE_SIZE), MARKETS_PAGE_SIZE)
+            endpoint = f"{COINGECKO_API_URL}/coins/markets"
+            headers = {"x-cg-demo-api-key": CG_API_KEY} if CG_API_KEY else None
+
+            pages = [ids[i:i + per_page] for i in range(0, len(ids), per_page)]
+            results = await asyncio.gather(*(
+                self._make_request(endpoint, {
+                    "vs_currency": "usd",
+                    "order": "market_cap_desc",
+                    "ids": ",".join(page),
+                    "per_page": per_page,
+                    "page": 1,
+                    "price_change_percentage": "1h,24h,7d,14d,30d"
+                }, headers=headers)
+                for page in pages
+            ))
+
+            tokens = {}
+            for data in results:
+                for coin in data:
+                    tokens[coin.get("id", "")] = self.token_data_from_market(coin)
+
+            if params.get("details", False):
+                details = await asyncio.gather(*(self.get_token_details(token_id) for token_id in tokens))
+                for token_id, detail in zip(list(tokens), details):
+                    tokens[token_id].update(detail)
+
+            return {"success": True, "data": tokens}
+        except Exception as e:
+            logger.error(f"Batch token data request failed: {e}")
+            return {"success": False, "error": str(e)}
+
+    async def get_token_details(self, token_id: str) -> Dict[str, Any]:
+        """Fetch only the fields /coins/markets lacks for one token"""
+        endpoint = f"{COINGECKO_API_URL}/coins/{token_id}"
+        api_params = {
+            "localization": "false",
+            "tickers": "false",
+            "market_data": "false",
+            "community_data": "true",
+            "developer_data": "true",
+            "sparkline": "false"
+        }
+        headers = {"x-cg-demo-api-key": CG_API_KEY} if CG_API_KEY else None
+        try:
+            data = await self._make_request(endpoint, api_params, headers=headers)
+        except Exception as e:
+            logger.warning(f"Token detail request failed for {token_id}: {e}")
+            data = {}
+        return self.token_details_from_coin(data)
+
+    def token_data_from_market(self, coin: Dict[str, Any]) -> Dict[str, Any]:
+        """Map a /coins/markets row onto the get_token_data fields"""
+        token_data = {
+            "id": coin.get("id", ""),
+            "symbol": coin.get("symbol", "").upper(),
+            "name": coin.get("name", ""),
+            "price": coin.get("current_price", 0),
+            "market_cap": coin.get("market_cap", 0),
+            "volume_24h": coin.get("total_volume", 0),
+            "price_change_1h": coin.get("price_change_percentage_1h_in_currency", 0),
+            "price_change_24h": coin.get("price_change_percentage_24h", 0),
+            "price_change_7d": coin.get("price_change_percentage_7d_in_currency", 0),
+            "price_change_14d": coin.get("price_change_percentage_14d_in_currency", 0),
+            "price_change_30d": coin.get("price_change_percentage_30d_in_currency", 0),
+            "all_time_high": coin.get("ath", 0),
+            "all_time_low": coin.get("atl", 0),
+            "circulating_supply": coin.get("circulating_supply", 0),
+            "total_supply": coin.get("total_supply", 0),
+            "max_supply": coin.get("max_supply", 0),
+            "market_cap_rank": coin.get("market_cap_rank", 0),
+        }
+        token_data.update(self.token_details_from_coin({}))
+        return token_data
+
+    def token_details_from_coin(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Extract the /coins/{id}-only fields (scores, votes, links)"""
+        return {
+            "sentiment_votes_up_percentage": data.get("sentiment_votes_up_percentage", 0),
+            "sentiment_votes_down_percentage": data.get("sentiment_votes_down_percentage", 0),
+            "community_score": data.get("community_score", 0),
+            "developer_score": data.get("developer_score", 0),
+            "liquidity_score": data.get("liquidity_score", 0),
+            "public_interest_score": data.get("public_interest_score", 0),
+            "links": {
+                "homepage": data.get("links", {}).get("homepage", []),
+                "blockchain_site": data.get("links", {}).get("blockchain_site", []),
+                "official_forum_url": data.get("links", {}).get("official_forum_url", []),
+                "chat_url": data.get("links", {}).get("chat_url", []),
+                "twitter_screen_name": data.get("links", {}).get("twitter_screen_name", ""),
+                "telegram_channel_identifier": data.get("links", {}).get("telegram_channel_identifier", ""),
+                "subreddit_url": data.get("links", {}).get("subreddit_url", "")
+            }
+        }
+
     async def get_market_overview(self, params: Dict[str, Any]) -> Dict[str, Any]:
         """Get market overview including fear & greed index"""
         try:
@@ -351,48 +1703,47 @@ class MarketData():
 class NewsAndSocialMediaData():
     def __init__(self):
         self.session = None
-        try:
-            self.twitter_client = tweepy.Client(
-                bearer_token=TWITTER_BEARER_TOKEN,
-                wait_on_rate_limit=True
-            )
-        except Exception as e:
-            logger.warning(f"Twitter client initialization failed: {e}")
+
+    @property
+    def twitter_client(self) -> Optional[tweepy.Client]:
+        return social_clients.twitter()
 
     async def _make_request(self, endpoint: str, params: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
         """Make HTTP request with optional headers"""
         try:
             logger.info(f"#### API request to {endpoint} - {headers} - {params}" )
-            async with aiohttp.ClientSession() as session:
-                async with session.get(endpoint, params=params, headers=headers) as response:
-                    response.raise_for_status()
-                    data = await response.json()
-                    logger.debug(f"API request to {endpoint} successful")
-                    return data
+            cache_key = get_cache_key(endpoint, params)
+            return await single_flight.do(cache_key, lambda: fetch_json(endpoint, params, headers))
         except Exception as e:
             logger.error(f"API request failed for {endpoint}: {e}")
             raise Exception(f"API request failed: {e}")
 
+    async def close(self) -> None:
+        """Release the pooled HTTP session and persist the sentiment memo"""
+        await http_sessions.close()
+        await asyncio.get_running_loop().run_in_executor(None, sentiment_cache.save)
+
     async def get_social_sentiment(self, params: Dict[str, Any]) -> Dict[str, Any]:
         """Get social media sentiment analysis for a token"""
         try:
             token = params.get("token", "")
             limit = params.get("limit", 100)
 
-            twitter_posts = await self.fetch_twitter_posts(token, limit // 2)
-            reddit_posts = await self.fetch_reddit_posts(token, limit // 2)
+            twitter_posts, reddit_posts = await asyncio.gather(
+                self.fetch_twitter_posts(token, limit // 2),
+                self.fetch_reddit_posts(token, limit // 2)
+            )
 
             all_posts = twitter_posts + reddit_posts
             sentiment_scores = []
             analyzed_posts = []
 
-            for post in all_posts:
-                content = post.get("text", "")
-                if not content:
-                    continue
-                    
-                blob = TextBlob(content)
-                sentiment_score = (blob.sentiment.polarity + 1) * 50
+            scored_posts = [post for post in all_posts if post.get("text", "")]
+            polarities = sentiment_cache.polarities([post["text"] for post in scored_posts])
+
+            for post, polarity in zip(scored_posts, polarities):
+                content = post["text"]
+                sentiment_score = (polarity + 1) * 50
                 sentiment_scores.append(sentiment_score)
 
                 analyzed_posts.append({
@@ -438,45 +1789,60 @@ class NewsAndSocialMediaData():
 
     async def fetch_reddit_posts(self, token: str, limit: int) -> List[Dict[str, Any]]:
         """Fetch Reddit posts about a token using praw"""
-        posts = []
         try:
-            reddit = praw.Reddit(
-                client_id=REDDIT_CLIENT_ID,
-                client_secret=REDDIT_CLIENT_SECRET,
-                user_agent=REDDIT_USER_AGENT
-            )
-            for post in reddit.subreddit("all").search(token, limit=limit):
-                engagement = (
-                    (post.num_comments or 0) +
-                    (post.clicked or 0) +
-                    (post.score or 0)
-                )
-                posts.append({ 
-                    "platform": "reddit",
-                    "text": post.selftext or "",
-                    "author": str(post.author) if post.author else "",
-                    "created_at": datetime.utcfromtimestamp(post.created_utc).isoformat(),
-                    "engagement": engagement
-                })
-
+            return await run_blocking("reddit", self._search_reddit, token, limit)
+        except asyncio.TimeoutError:
+            logger.warning(f"Reddit fetch timed out for {token}")
         except Exception as e:
             logger.warning(f"Reddit fetch failed: {e}")
+        return []
+
+    def _search_reddit(self, token: str, limit: int) -> List[Dict[str, Any]]:
+        posts = []
+        reddit = social_clients.reddit()
+        for post in reddit.subreddit("all").search(token, limit=limit):
+            engagement = (
+                (post.num_comments or 0) +
+                (post.clicked or 0) +
+                (post.score or 0)
+            )
+            posts.append({ 
+                "platform": "reddit",
+                "text": post.selftext or "",
+                "author": str(post.author) if post.author else "",
+                "created_at": datetime.utcfromtimestamp(post.created_utc).isoformat(),
+                "engagement": engagement
+            })
         return posts
 
+    def _search_tweets(self, token: str, max_results: int):
+        query = f"${token} OR #{token} OR {token} -is:retweet lang:en"
+        start = time.monotonic()
+        error = False
+        try:
+            return self.twitter_client.search_recent_tweets(
+                query=query,
+                max_results=max_results,
+                tweet_fields=["created_at", "author_id", "public_metrics"]
+            )
+        except tweepy.TooManyRequests as e:
+            social_clients.record_rate_limit(e.response)
+            raise
+        except Exception:
+            error = True
+            raise
+        finally:
+            social_clients.record_request("twitter", time.monotonic() - start, error)
+
     async def fetch_twitter_posts(self, token: str, limit: int) -> List[Dict[str, Any]]:
         """Fetch Twitter posts about a token"""
         posts = []
         
-        if not self.twitter_client:
+        if not self.twitter_client or social_clients.twitter_rate_limited():
             return posts
         
         try:
-            query = f"${token} OR #{token} OR {token} -is:retweet lang:en"
-            tweets = self.twitter_client.search_recent_tweets(
-                query=query,
-                max_results=min(limit, 100),
-                tweet_fields=["created_at", "author_id", "public_metrics"]
-            )
+            tweets = await run_blocking("twitter", self._search_tweets, token, min(limit, 100))
             
             if tweets.data:
                 for tweet in tweets.data:
@@ -493,6 +1859,10 @@ class NewsAndSocialMediaData():
                         "engagement": engagement
                     })
         
+        except asyncio.TimeoutError:
+            logger.warning(f"Twitter fetch timed out for {token}")
+        except tweepy.TooManyRequests:
+            logger.info(f"Twitter rate limited, no tweets for {token} this cycle")
         except Exception as e:
             logger.warning(f"Twitter fetch failed: {e}")
         
@@ -504,12 +1874,9 @@ class NewsAndSocialMediaData():
             token = params.get("token", "")
             if not self.twitter_client:
                 return {"success": False, "error": "Twitter client not initialized"}
-            query = f"${token} OR #{token} OR {token} -is:retweet lang:en"
-            tweets = self.twitter_client.search_recent_tweets(
-                query=query,
-                max_results=100,
-                tweet_fields=["created_at", "author_id", "public_metrics"]
-            )
+            if social_clients.twitter_rate_limited():
+                return {"success": False, "error": "Twitter rate limited"}
+            tweets = await run_blocking("twitter", self._search_tweets, token, 100)
             total_tweets = len(tweets.data) if tweets.data else 0
             total_likes = sum(tweet.public_metrics.get("like_count", 0) for tweet in tweets.data) if tweets.data else 0
             total_retweets = sum(tweet.public_metrics.get("retweet_count", 0) for tweet in tweets.data) if tweets.data else 0
@@ -523,6 +1890,11 @@ class NewsAndSocialMediaData():
                 "timestamp": datetime.now().isoformat()
             }
             return {"success": True, "data": response_data}
+        except asyncio.TimeoutError:
+            logger.error(f"Twitter metrics retrieval timed out for {params.get('token', '')}")
+            return {"success": False, "error": "Twitter request timed out"}
+        except tweepy.TooManyRequests:
+            return {"success": False, "error": "Twitter rate limited"}
         except Exception as e:
             logger.error(f"Twitter metrics retrieval failed: {e}")
             return {"success": False, "error": str(e)}
@@ -541,15 +1913,14 @@ class NewsAndSocialMediaData():
         try:
             token = params.get("token", "")
             days = params.get("days", 7)
-            news_articles = await self.fetch_news_articles(token, days)
+            news_articles = await self.fetch_news_articles(token, days, params.get("name"))
             sentiment_scores = []
             article_sentiments = []
-            for article in news_articles:
+            polarities = sentiment_cache.polarities([
+                f"{article.get('title', '')}. {article.get('description', '')}" for article in news_articles
+            ])
+            for article, sentiment_score in zip(news_articles, polarities):
                 title = article.get("title", "")
-                description = article.get("description", "")
-                content = f"{title}. {description}"
-                blob = TextBlob(content)
-                sentiment_score = blob.sentiment.polarity
                 normalized_score = (sentiment_score + 1) * 50
                 sentiment_scores.append(normalized_score)
                 article_sentiments.append({
@@ -579,8 +1950,15 @@ class NewsAndSocialMediaData():
             logger.error(f"News sentiment analysis failed: {e}")
             return {"success": False, "error": str(e)}
 
-    async def fetch_news_articles(self, token: str, days: int) -> List[Dict[str, Any]]:
+    async def fetch_news_articles(self, token: str, days: int, name: Optional[str] = None) -> List[Dict[str, Any]]:
         """Fetch news articles for a token"""
+        newsapi_articles, rss_articles = await asyncio.gather(
+            self.fetch_newsapi_articles(token, days),
+            self.fetch_rss_articles(token, name)
+        )
+        return newsapi_articles + rss_articles
+
+    async def fetch_newsapi_articles(self, token: str, days: int) -> List[Dict[str, Any]]:
         articles = []
         try:
             from_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
@@ -596,19 +1974,14 @@ class NewsAndSocialMediaData():
             articles.extend(data.get("articles", []))
         except Exception as e:
             logger.warning(f"NewsAPI request failed: {e}")
+        return articles
+
+    async def fetch_rss_articles(self, token: str, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Look up a token's symbol and name in the shared RSS feed index"""
         try:
-            feed_url = "https://www.coindesk.com/arc/outboundfeeds/rss/"
-            feed_data = feedparser.parse(feed_url)
-            for entry in feed_data.entries[:20]:
-                if token.lower() in entry.title.lower() or token.lower() in entry.summary.lower():
-                    articles.append({
-                        "title": entry.title,
-                        "description": entry.summary,
-                        "url": entry.link,
-                        "publishedAt": entry.published
-                    })
+            return await feed_cache.search(token, name)
         except Exception as e:
-            logger.warning(f"CoinDesk RSS fetch failed: {e}")
-        return articles
+            logger.warning(f"RSS lookup failed: {e}")
+            return []
+    
     
-    
\ No newline at end of file
@@ -11,10 +11,15 @@ from web3 import Web3
 import json
 import os
 from dotenv import load_dotenv
-from MarketAndNewsDataMCP import MarketData, NewsAndSocialMediaData
+from MarketAndNewsDataMCP import MarketData, NewsAndSocialMediaData, cache as response_cache, single_flight, rate_limiter, social_clients, feed_cache, sentiment_cache, sentiment_engine, price_history, PriceRing, market_history
 from openai import OpenAI
 import uuid
 from pickledb import PickleDB
+from message_log import MessageLog
+from chain import ChainClient, Multicall, PortfolioState
+from event_index import EventIndex
+import scoring
+import risk_stats
 import asyncio
 import logging
 import numpy as np
@@ -35,6 +40,10 @@ UNIPOOL_CONTRACT_ADDRESS = os.getenv("UNIPOOL_CONTRACT_ADDRESS")
 UNIPOOL_CONTRACT_ABI = None
 TOKENS_TO_WATCH=['bitcoin', 'uniswap', 'ethereum', 'compound-governance-token']
 CG_API_KEY = os.getenv("CG_API_KEY")
+RESEARCH_CONCURRENCY = int(os.getenv("RESEARCH_CONCURRENCY", 4))  # tokens researched in parallel, 1 = sequential
+RISK_WINDOW = int(os.getenv("RISK_WINDOW", 1440))  # returns kept by the risk accumulator, 0 = since start
+RISK_MIN_SAMPLES = int(os.getenv("RISK_MIN_SAMPLES", 30))  # portfolio returns needed before its metrics go to the dashboard
+SOCKET_BATCH_WINDOW = float(os.getenv("SOCKET_BATCH_WINDOW", 0.1))  # seconds, 0 = emit every message at once
 
 
 # Logging setup
@@ -49,25 +58,167 @@ TOKENS_TO_ADDRESS=[{'USDC':"0x078D782b760474a361dDA0AF3839290b0EF57AD6"}, {'bitc
 with open('abi.json') as f:
     UNIPOOL_CONTRACT_ABI = json.load(f)
 
+chain = ChainClient(PROVIDER_URL, UNIPOOL_CONTRACT_ADDRESS, UNIPOOL_CONTRACT_ABI)
+portfolio_state = PortfolioState(chain, Multicall(chain))
+# Unipool event history; newly indexed events are also published on "chain_events"
+event_index = EventIndex(chain, on_events=lambda events: [mcp_publish("chain_events", event) for event in events])
+
 
 mcp_app = Flask(__name__)
 CORS(mcp_app)             
 socketio = SocketIO(mcp_app, cors_allowed_origins="*") 
 
-# --- Persistent Message Queue Storage with PickleDB ---
-PICKLEDB_PATH = 'message_queues.db'
+# --- Persistent Message Queue Storage: append-only log per topic ---
+PICKLEDB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'message_queues.db')  # legacy store, imported once into the message log
+
+def load_message_log():
+    log = MessageLog()
+    if not log.recover() and os.path.exists(PICKLEDB_PATH):
+        db = PickleDB(PICKLEDB_PATH)
+        for topic in db.all():
+            for message in db.get(topic):
+                log.append(topic, message)
+        log.sync()
+    return log
+
+message_log = load_message_log()
+
+
+class SocketEmitter:
+    """Batches Socket.IO fan-out to the dashboard.
+
+    Messages published within SOCKET_BATCH_WINDOW seconds go out as one
+    'batch' frame: {"topics": {topic: [{"seq", "message"}, ...]}}. Within a
+    batch only the latest message per token is kept for the topics in
+    COALESCE_KEYS, since a newer score supersedes the previous one.
+    """
+    COALESCE_KEYS = {"market_data": "token", "risk_metrics": "symbol"}
+
+    def __init__(self, socketio, window=SOCKET_BATCH_WINDOW):
+        self.socketio = socketio
+        self.window = window
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.flusher = None
+        self.messages = 0
+        self.coalesced = 0
+        self.frames = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def publish(self, topic, message, seq):
+        if self.window <= 0:
+            self.socketio.emit(topic, {'message': message, 'seq': seq})
+            with self.lock:
+                self.messages += 1
+                self.frames += 1
+            return
+        key_field = self.COALESCE_KEYS.get(topic)
+        key = message.get(key_field) if key_field and isinstance(message, dict) else None
+        with self.lock:
+            bucket = self.pending.setdefault(topic, {})
+            key = seq if key is None else key
+            if key in bucket:
+                del bucket[key]
+                self.coalesced += 1
+            bucket[key] = (seq, message, time.monotonic())
+            self.messages += 1
+            if self.flusher is None:
+                self.flusher = self.socketio.start_background_task(self.run)
+        self.wakeup.set()
+
+    def run(self):
+        while True:
+            self.wakeup.wait()
+            self.socketio.sleep(self.window)
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.wakeup.clear()
+        if not pending:
+            return
+        frame = {"topics": {
+            topic: [{"seq": seq, "message": message} for seq, message, _ in bucket.values()]
+            for topic, bucket in pending.items()
+        }}
+        self.socketio.emit("batch", frame)
+        now = time.monotonic()
+        with self.lock:
+            self.frames += 1
+            for bucket in pending.values():
+                for _, _, published_at in bucket.values():
+                    latency = now - published_at
+                    self.latency_total += latency
+                    self.latency_max = max(self.latency_max, latency)
+
+    def stats(self):
+        with self.lock:
+            sent = self.messages - self.coalesced
+            return {
+                "window": self.window,
+                "messages": self.messages,
+                "coalesced": self.coalesced,
+                "frames": self.frames,
+                "messages_per_frame": sent / self.frames if self.frames else 0.0,
+                "avg_latency_ms": 1000 * self.latency_total / sent if sent and self.window > 0 else 0.0,
+                "max_latency_ms": 1000 * self.latency_max
+            }
+
+socket_emitter = SocketEmitter(socketio)
+
 
-def load_message_queues():
-    db = PickleDB(PICKLEDB_PATH)
-    mq = defaultdict(lambda: deque(maxlen=200))
-    for topic in db.all():
-        mq[topic] = deque(db.get(topic), maxlen=200)
-    return mq, db
+SNAPSHOT_SIZE = 5  # latest messages per topic replayed to a connecting client
 
-def save_message_queue(db, topic, queue):
-    db.set(topic, list(queue))
+class TopicSnapshots:
+    """Latest SNAPSHOT_SIZE messages per topic, shared by every connecting client.
 
-message_queues, mqdb = load_message_queues()
+    The per-topic lists are rebuilt at most once per publish, not per
+    connection; a client with no cursors gets the same cached frame object.
+    """
+    def __init__(self, size=SNAPSHOT_SIZE):
+        self.size = size
+        self.entries = defaultdict(lambda: deque(maxlen=size))
+        self.lock = threading.Lock()
+        self.frame_cache = None
+        self.rebuilds = 0
+        self.served = 0
+
+    def seed(self, log):
+        for topic in log.retained():
+            for seq, message in log.read(topic)[-self.size:]:
+                self.add(topic, seq, message)
+
+    def add(self, topic, seq, message):
+        with self.lock:
+            self.entries[topic].append({"seq": seq, "message": message})
+            self.frame_cache = None
+
+    def frame(self, cursors=None):
+        """{"topics": {topic: [{seq, message}]}} holding only messages newer than `cursors`"""
+        with self.lock:
+            if self.frame_cache is None:
+                self.frame_cache = {"topics": {topic: list(entries) for topic, entries in self.entries.items() if entries}}
+                self.rebuilds += 1
+            frame = self.frame_cache
+            self.served += 1
+        if not cursors:
+            return frame
+        topics = {}
+        for topic, entries in frame["topics"].items():
+            missing = [entry for entry in entries if entry["seq"] > cursors.get(topic, -1)]
+            if missing:
+                topics[topic] = missing
+        return {"topics": topics}
+
+    def stats(self):
+        with self.lock:
+            return {"topics": len(self.entries), "rebuilds": self.rebuilds, "served": self.served}
+
+topic_snapshots = TopicSnapshots()
+topic_snapshots.seed(message_log)
 
 
 
@@ -75,22 +226,17 @@ message_queues, mqdb = load_message_queues()
 def get_asset_balances():
     try:
         print("get_balances")
-        if not all([PROVIDER_URL, UNIPOOL_CONTRACT_ADDRESS, UNIPOOL_CONTRACT_ABI]):
+        if not chain.configured:
             return jsonify({"success": False, "error": "Contract/web3 config missing"}), 500
 
-        w3 = Web3(Web3.HTTPProvider(PROVIDER_URL))
-        if not w3.is_connected():
+        if not chain.ready():
             return jsonify({"success": False, "error": "Web3 connection failed"}), 500
 
-        contract = w3.eth.contract(
-            address=Web3.to_checksum_address(UNIPOOL_CONTRACT_ADDRESS),
-            abi=UNIPOOL_CONTRACT_ABI
-        )
-        addresses = contract.functions.portfolioAssetsList().call()
+        addresses = portfolio_state.get("portfolioAssetsList")
         pprint.pprint(addresses)
         result = [
             {
-                "address": w3.to_checksum_address(addr)
+                "address": Web3.to_checksum_address(addr)
             }
             for addr in  addresses
         ]
@@ -100,16 +246,136 @@ def get_asset_balances():
         print(f"[API] Error get_balances(): {e}") 
         return jsonify({"success": False, "error": str(e)}), 500
 
+@mcp_app.route('/contract/portfolio-state', methods=['GET'])
+def get_portfolio_state():
+    """Portfolio assets, balances, value and shares from the per-block cache"""
+    try:
+        if not chain.configured:
+            return jsonify({"success": False, "error": "Contract/web3 config missing"}), 500
+        if not chain.ready():
+            return jsonify({"success": False, "error": "Web3 connection failed"}), 500
+        state = portfolio_state.snapshot()
+        assets, balances = state["assetBalances"]
+        return jsonify({
+            "assets": [Web3.to_checksum_address(addr) for addr in state["portfolioAssetsList"]],
+            "balances": {Web3.to_checksum_address(addr): str(balance) for addr, balance in zip(assets, balances)},
+            "portfolio_value": str(state["getPortfolioValue"]),
+            "total_shares": str(state["totalShares"]),
+            "block_number": state["block_number"],
+            "success": True
+        })
+    except Exception as e:
+        print(f"[API] Error get_portfolio_state(): {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@mcp_app.route('/contract/portfolio-valuation', methods=['GET'])
+def get_portfolio_valuation():
+    """Balances, oracle prices and share values in two multicall round trips.
+
+    ?users=0xabc,0xdef adds getUserShareValue for each user.
+    """
+    try:
+        if not chain.configured:
+            return jsonify({"success": False, "error": "Contract/web3 config missing"}), 500
+        if not chain.ready():
+            return jsonify({"success": False, "error": "Web3 connection failed"}), 500
+        users = [user for user in request.args.get("users", "").split(",") if user]
+        return jsonify({**portfolio_state.valuation(users), "success": True})
+    except Exception as e:
+        print(f"[API] Error get_portfolio_valuation(): {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+def history_args():
+    """Block range and limit shared by the /history endpoints"""
+    def block(name):
+        value = request.args.get(name)
+        return int(value) if value not in (None, "") else None
+    return {"from_block": block("from_block"), "to_block": block("to_block"),
+            "limit": min(int(request.args.get("limit", 100)), 1000)}
+
+@mcp_app.route('/history/activity', methods=['GET'])
+def get_history_activity():
+    """Indexed Unipool events of every kind, newest first (?event=Invest to filter)"""
+    try:
+        return jsonify({"events": event_index.activity(request.args.get("event"), **history_args()),
+                        "checkpoint": event_index.checkpoint(), "success": True})
+    except Exception as e:
+        print(f"[API] Error get_history_activity(): {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@mcp_app.route('/history/trades', methods=['GET'])
+def get_history_trades():
+    """AssetSwapped history, newest first (?token=0x... for swaps in or out of a token)"""
+    try:
+        return jsonify({"trades": event_index.trades(request.args.get("token"), **history_args()),
+                        "checkpoint": event_index.checkpoint(), "success": True})
+    except Exception as e:
+        print(f"[API] Error get_history_trades(): {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@mcp_app.route('/history/rebalances', methods=['GET'])
+def get_history_rebalances():
+    """Rebalanced history, newest first (?token=0x... for rebalances selling or buying a token)"""
+    try:
+        return jsonify({"rebalances": event_index.rebalances(request.args.get("token"), **history_args()),
+                        "checkpoint": event_index.checkpoint(), "success": True})
+    except Exception as e:
+        print(f"[API] Error get_history_rebalances(): {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@mcp_app.route('/history/flows', methods=['GET'])
+def get_history_flows():
+    """Invest/Withdraw history, newest first (?user=0x...&kind=invest|withdraw), with per-user totals"""
+    try:
+        user, kind, args = request.args.get("user"), request.args.get("kind"), history_args()
+        return jsonify({"flows": event_index.flows(user, kind, **args),
+                        "totals": event_index.flow_totals(user, kind, args["from_block"], args["to_block"]),
+                        "checkpoint": event_index.checkpoint(), "success": True})
+    except Exception as e:
+        print(f"[API] Error get_history_flows(): {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@mcp_app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Operational counters for the data layer (cache hit ratio etc.)"""
+    return jsonify({
+        "cache": response_cache.stats(),
+        "single_flight": single_flight.stats(),
+        "rate_limits": rate_limiter.stats(),
+        "social": social_clients.stats(),
+        "feeds": feed_cache.stats(),
+        "sentiment_cache": sentiment_cache.stats(),
+        "sentiment_engine": sentiment_engine.stats(),
+        "price_history": price_history.stats(),
+        "market_history": market_history.stats(),
+        "message_log": message_log.stats(),
+        "socket_emitter": socket_emitter.stats(),
+        "snapshots": topic_snapshots.stats(),
+        "chain": chain.stats(),
+        "portfolio_state": portfolio_state.stats(),
+        "event_index": event_index.stats(),
+        "success": True
+    })
+
 @socketio.on('connect')
-def handle_connect():
-    """Handles a new client connecting to the WebSocket."""
+def handle_connect(auth=None):
+    """Handles a new client connecting to the WebSocket.
+
+    The client may send {"cursors": {topic: last_seq}} as its auth payload;
+    it then gets one 'snapshot' frame with only the messages it missed.
+    """
     #print("[MCP Server] React UI connected to WebSocket.", request.sid)
     sid = request.sid
-    for topic, queue in message_queues.items():
-        messages = list(queue)[-5:]
-        if messages:
-            for msg in messages:
-                socketio.emit(topic, {"message": msg}, room=sid)
+    cursors = {}
+    if isinstance(auth, dict) and isinstance(auth.get("cursors"), dict):
+        for topic, seq in auth["cursors"].items():
+            try:
+                cursors[topic] = int(seq)
+            except (TypeError, ValueError):
+                pass
+    frame = topic_snapshots.frame(cursors)
+    if frame["topics"]:
+        socketio.emit("snapshot", frame, room=sid)
 
 
 @socketio.on('disconnect')
@@ -127,24 +393,58 @@ def run_mcp_server():
     socketio.run(mcp_app, port=PORT, host='0.0.0.0', debug=False, use_reloader=False)
 
 def mcp_publish(topic, message):
+    """Append a message to a topic and return its sequence number"""
     try:
         print("##### NEW MESSAGE IN THE TOPIC: ", topic)
         print(message)
-        message_queues[topic].append(message)
-
-        save_message_queue(mqdb, topic, message_queues[topic])  # persist
-        socketio.emit(topic, {'message': message})
+        seq = message_log.append(topic, message)  # persist, fsync'd by the group commit
+        topic_snapshots.add(topic, seq, message)
+        socket_emitter.publish(topic, message, seq)
+        return seq
 
     except requests.exceptions.RequestException as e:
         print(f"[Agent Error] Could not publish to MCP: {e}")
 
 def mcp_subscribe(topic):
-    try:
-        messages = list(message_queues[topic])
-        return messages
-    except requests.exceptions.RequestException as e:
-        print(f"[Agent Error] Could not subscribe to MCP: {e}")
-        return []
+    """Retained messages of a topic, oldest first"""
+    return [message for _, message in message_log.read(topic)]
+
+def mcp_read(topic, cursor=-1):
+    """Retained (seq, message) pairs of a topic published after `cursor`"""
+    return message_log.read(topic, cursor)
+
+def mcp_register(consumer, topics, start="latest"):
+    """Give `consumer` a durable cursor on each topic it has none for yet.
+
+    Agents register when they are created, before the scheduler runs them,
+    so nothing published between startup and their first consume is
+    skipped. A new cursor starts after the newest message (start="latest")
+    or before the oldest retained one (start="earliest").
+    """
+    for topic in topics:
+        if message_log.cursor(consumer, topic) is None:
+            message_log.commit(consumer, topic, message_log.last_seq(topic) if start == "latest" else -1)
+
+def mcp_consume(consumer, topic):
+    """(seq, message) pairs `consumer` has not acknowledged yet.
+
+    Only the last MESSAGE_QUEUE_SIZE messages of a topic are retained.
+    """
+    cursor = message_log.cursor(consumer, topic)
+    return message_log.read(topic, -1 if cursor is None else cursor)
+
+def mcp_ack(consumer, topic, seq):
+    """Durably move `consumer`'s offset on `topic` to `seq`"""
+    message_log.commit(consumer, topic, seq)
+
+def mcp_wait(cursors, timeout=None):
+    """Block until a topic in `cursors` ({topic: seq}) has a newer message; False on timeout"""
+    return message_log.wait(list(cursors), cursors, timeout)
+
+async def mcp_wait_async(cursors, timeout=None):
+    """mcp_wait for coroutines: the wait runs on the default executor"""
+    return await asyncio.get_running_loop().run_in_executor(None, mcp_wait, cursors, timeout)
+
 
 
 def execute_rebalance(sell_assets, sell_amounts_bps, buy_assets, buy_amounts_bps) -> str:
@@ -160,22 +460,19 @@ def execute_rebalance(sell_assets, sell_amounts_bps, buy_assets, buy_amounts_bps
         print("Error: Please set PROVIDER_URL, TRADER_AGENT_PRIVATE_KEY, and UNIPOOL_CONTRACT_ADDRESS in your .env file.")
         return
 
-    # 1. Connect to the Ethereum node
-    w3 = Web3(Web3.HTTPProvider(PROVIDER_URL))
-    if not w3.is_connected():
+    # 1. Shared connection to the Ethereum node (health checked in the background)
+    if not chain.ready():
         print("Error: Could not connect to the Ethereum node.")
         return
-    print(f"Successfully connected to provider. Chain ID: {w3.eth.chain_id}")
+    w3 = chain.w3
+    print(f"Successfully connected to provider. Chain ID: {chain.chain_id}")
 
     # 2. Set up the trader's account from the private key
-    trader_account = w3.eth.account.from_key(TRADER_AGENT_PRIVATE_KEY)
+    trader_account = chain.account(TRADER_AGENT_PRIVATE_KEY)
     print(f"Trader-Agent wallet address: {trader_account.address}")
 
     # 3. Load the smart contract
-    unipool_contract = w3.eth.contract(
-        address=Web3.to_checksum_address(UNIPOOL_CONTRACT_ADDRESS),
-        abi=UNIPOOL_CONTRACT_ABI
-    )
+    unipool_contract = chain.contract()
 
     # Convert addresses to checksum format
     sell_assets_checksum = [Web3.to_checksum_address(addr) for addr in sell_assets]
@@ -195,7 +492,7 @@ def execute_rebalance(sell_assets, sell_amounts_bps, buy_assets, buy_amounts_bps
             'gas': 500000, 
             'gasPrice': w3.eth.gas_price,
             'nonce': w3.eth.get_transaction_count(trader_account.address),
-            'chainId': w3.eth.chain_id
+            'chainId': chain.chain_id
         })
         print("Transaction built successfully.")
     except Exception as e:
@@ -216,6 +513,7 @@ def execute_rebalance(sell_assets, sell_amounts_bps, buy_assets, buy_amounts_bps
         # 7. Wait for the transaction receipt (confirmation)
         print("Waiting for transaction receipt...")
         tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=180)
+        portfolio_state.invalidate(tx_receipt['blockNumber'])
         
         print("\n--- Transaction Confirmed ---")
         print(f"  Transaction Hash: {tx_receipt['transactionHash'].hex()}")
@@ -268,8 +566,9 @@ class ResearchInsight:
         }
 
 class ResearchAgent:
-    def __init__(self):
+    def __init__(self, concurrency=RESEARCH_CONCURRENCY):
         self.tokens_to_watch = TOKENS_TO_WATCH
+        self.concurrency = max(1, concurrency)
         self.market_data = MarketData()
         self.social_data = NewsAndSocialMediaData()
 
@@ -289,71 +588,39 @@ class ResearchAgent:
 
 
     def get_recommendation(self, score):
-        if score > 60:
+        if score > scoring.BUY_SCORE:
             return "BUY"
-        elif score < 25:
+        elif score < scoring.SELL_SCORE:
             return "SELL"
         else:
             return "HOLD"
 
     def calculate_technical_score(self, market_data):
-        price_change = market_data.get("price_change_24h", 0)
-        volume_change = market_data.get("volume_change_24h", 0)
-        score = 50
-        if price_change > 0:
-            score += min(price_change * 2, 30)
-        else:
-            score += max(price_change * 2, -30)
-        if volume_change > 0 and price_change > 0:
-            score += min(volume_change, 20)
-        return max(0, min(100, score))
+        fields = scoring.score_fields(market_data)
+        return float(scoring.technical_score_matrix(fields["price_change_24h"], fields["volume_change_24h"]))
 
     def calculate_market_score(self, market_data):
-        market_cap = market_data.get("market_cap", 0)
-        volume_24h = market_data.get("volume_24h", 0)
-        liquidity_ratio = volume_24h / market_cap if market_cap > 0 else 0
-        return min(liquidity_ratio * 1000, 50)
-
-    def technical_score(self, token):
-        weights = {
-            "price_change_1h": 0.4,
-            "price_change_24h": 0.3,
-            "price_change_7d": 0.2,
-            "price_change_14d": 0.05,
-            "price_change_30d": 0.05
-        }
-        market_health = np.log1p(token["market_cap"]) * 0.5 + np.log1p(token["volume_24h"]) * 0.5
-        momentum = 0
-        for key, w in weights.items():
-            change_pct = token[key]   
-            if change_pct < 0:
-                momentum += w * change_pct * 1.5  
-            else:
-                momentum += w * change_pct
-        raw_score = market_health + momentum
-        norm_score = 1 / (1 + np.exp(-raw_score / 1000))
-        scaled_score = 1 + norm_score * 99
-        return round(scaled_score, 2)
+        fields = scoring.score_fields(market_data)
+        return float(scoring.market_score_matrix(fields["market_cap"], fields["volume_24h"]))
 
     async def calculate_comprehensive_score(self, market_data, news_data, social_data) -> float:
-        technical_score = self.calculate_technical_score(market_data)
-        technical_score2 = self.technical_score(market_data)
-        print("Score 1, Score 2, ", technical_score, technical_score2)
-
-        news_score = news_data.get("sentiment_score", 50)
-        social_score = social_data.get("sentiment_score", 50)
-        market_score = self.calculate_market_score(market_data)
-        final_score = (
-            technical_score * 0.6 +
-            news_score * 0.2 +
-            social_score * 0.19 +
-            market_score * 0.01
-        )
-        return max(0, min(100, final_score))
+        score, _ = scoring.comprehensive_score_matrix(scoring.score_fields(market_data, news_data, social_data))
+        return float(score)
 
     def fetch_market_data_and_publish_wrapper(self):
         """A synchronous wrapper to run the async job."""
-        asyncio.run(self.fetch_market_data_and_publish())
+        asyncio.run(self.run_cycle())
+
+    async def run_cycle(self):
+        """One research cycle, releasing the pooled HTTP session when done."""
+        try:
+            await self.fetch_market_data_and_publish()
+        finally:
+            await self.close()
+
+    async def close(self):
+        await self.market_data.close()
+        await self.social_data.close()
 
     async def fetch_market_data_and_publish(self):
         print("[Research Agent] Fetching enriched market research data...")
@@ -370,25 +637,42 @@ class ResearchAgent:
 
         target_tokens = list(set(trending_coins + self.tokens_to_watch)) if trending_coins else self.tokens_to_watch
 
-        tokens_final = await self.market_data.get_market_data({"coins": ','.join(target_tokens) })
+        tokens_final = await self.market_data.get_tokens_data({"ids": target_tokens})
+        if not tokens_final["success"]:
+            print("[Research Agent] Failed to fetch market data:", tokens_final.get("error"))
+            return
 
-        for token in tokens_final['data']['tokens']:
-            # 2. Get detailed token data
-            market_resp = await self.market_data.get_token_data({"id": token['id'].lower()})
-            if not market_resp["success"]:
-                print(f"[Research Agent] Market data failed for {token['id']}: {market_resp.get('error')}")
-                continue
-            market_data = market_resp["data"]
+        # 2. Detailed token data for every token comes from the batched call above
+        tokens = list(tokens_final['data'].values())
+        if self.concurrency == 1:
+            for token in tokens:
+                await self.research_token(token)
+            return
+
+        # Tokens run in parallel up to self.concurrency; per-host request limits
+        # are enforced inside MarketData/NewsAndSocialMediaData.
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bounded_research(token):
+            async with semaphore:
+                await self.research_token(token)
+
+        await asyncio.gather(*(bounded_research(token) for token in tokens))
+
+    async def research_token(self, market_data):
+        """Fetch news and social sentiment concurrently for one token and publish its insight."""
+        try:
+            # 3. News sentiment and 4. social sentiment are independent
+            news_resp, social_resp = await asyncio.gather(
+                self.social_data.get_sentiment({"token": market_data['symbol'], "name": market_data['name']}),
+                self.social_data.get_social_sentiment({"token": market_data['symbol']})
+            )
 
-            # 3. News sentiment
-            news_resp = await self.social_data.get_sentiment({"token": token['symbol']})
             if not news_resp["success"]:
                 news_data = {"sentiment_score": 50, "overall_sentiment": "NEUTRAL", "confidence": 0.5}
             else:
                 news_data = news_resp["data"]
 
-            # 4. Social sentiment
-            social_resp = await self.social_data.get_social_sentiment({"token": token['symbol']})
             if not social_resp["success"]:
                 social_data = {"sentiment_score": 50, "confidence": 0.5}
             else:
@@ -398,7 +682,7 @@ class ResearchAgent:
             recommendation = self.get_recommendation(score)
 
             insight = ResearchInsight(
-                token_symbol=token['id'],
+                token_symbol=market_data['id'],
                 score=score,
                 sentiment=news_data.get("overall_sentiment", "NEUTRAL"),
                 confidence=  float(min(news_data.get("confidence", 0.5) + social_data.get("confidence", 0.5), 1.0)),
@@ -407,19 +691,24 @@ class ResearchAgent:
             )
 
             mcp_publish("market_data", insight.to_dict())
-            print(f"[Research Agent] Published insight for {token['id']}")
+            print(f"[Research Agent] Published insight for {market_data['id']}")
+        except Exception as e:
+            logger.error(f"Research failed for {market_data.get('id')}: {e}")
 
     def run(self):
         try:
             print("[Research Agent] Starting async market research loop...")
-            asyncio.run(self.fetch_market_data_and_publish())
+            asyncio.run(self.run_cycle())
         except Exception as e:
             print(f"Error: {e}")
 
 # --- RISK AGENT (No changes needed here) ---
 class RiskAgent:
     def __init__(self):
-        self.portfolio_history = []
+        self.portfolio_history = PriceRing()  # equal-weighted index of the watched tokens
+        self.portfolio_seen = {}              # token id -> PriceRing.total already folded in
+        self.risk_accumulator = risk_stats.RiskAccumulator(window=RISK_WINDOW)
+        self.risk_metrics = None
         self.market_data = MarketData()
         self.risk_thresholds = {
             "max_var": 0.05,  # 5% daily VaR
@@ -433,9 +722,11 @@ class RiskAgent:
         try:
             await self.perform_risk_check()
             await self.check_market_anomalies()
+            await self.market_data.close()
             await asyncio.sleep(60)
         except Exception as e:
             print(f"Risk monitoring error: {e}")
+            await self.market_data.close()
             await asyncio.sleep(120)
 
     def run_continuous_monitoring_wrapper(self):
@@ -458,59 +749,72 @@ class RiskAgent:
             for token in risk_scores:
                 mcp_publish("risk_metrics", token)
 
-            #await self.check_risk_alerts(risk_metrics)
+            self.risk_metrics = self.calculate_risk_metrics(self.portfolio_data(portfolio_tokens_ids))
+            # Portfolio VaR/Sharpe/drawdown are shown on the dashboard only. They are per
+            # risk poll while risk_thresholds are daily/annual-scale, so they feed neither
+            # the PM (risk_metrics) nor the alerts. Until the window holds RISK_MIN_SAMPLES
+            # returns they are too noisy to show.
+            samples = self.risk_accumulator.count
+            if samples >= RISK_MIN_SAMPLES:
+                metrics = self.risk_metrics
+                mcp_publish("portfolio_risk", {"samples": samples, "var_95": metrics.var_95, "sharpe_ratio": metrics.sharpe_ratio,
+                                               "volatility": metrics.volatility, "max_drawdown": metrics.max_drawdown})
+            #await self.check_risk_alerts(self.risk_metrics)
         except Exception as e:
             logger.error(f"Risk check failed: {e}")
 
 
-    def performance_risk_score(self, tokens, weights=(0.6, 0.3, 0.05, 0.05)):
-        results = []
-        negative_factor=2
-        weights_arr = np.array(weights)
-        for token in tokens:
-            print(token)
-            changes = np.array([
-                token["price_change_1h"],
-                token["price_change_24h"],
-                token["price_change_7d"],
-                token["price_change_14d"]
-            ])
-            factors = np.where(
-                changes < 0,
-                1 + np.abs(changes)*2 / 100,        
-                1 / (1 + changes*2 / 100)         
-            )
-            penalized_changes = changes * factors
-            mean = np.average(penalized_changes, weights=weights_arr)
-            var = np.average((penalized_changes - mean) ** 2, weights=weights_arr)
-            std_risk = np.sqrt(var)
-            print(std_risk)
-            results.append({
-                "symbol": token["id"],
-                "std_risk": float(std_risk)
-            })
+    def portfolio_data(self, token_ids):
+        """Returns since the last check and price windows, read from price_history.
 
-        std_values = [r["std_risk"] for r in results]
-        min_val, max_val = min(std_values), max(std_values)
-        print(min_val, max_val)
-        for r in results:
-            if max_val != min_val:
-                print((  r["std_risk"] - min_val ), (max_val - min_val) )
-                r["RiskScore"] = float(   (  r["std_risk"] - min_val ) / (max_val - min_val))
-            else:
-                r["RiskScore"] = 0.0
-
-        results.sort(key=lambda x: x["RiskScore"], reverse=True)
-        return results
-
-    def calculate_risk_metrics(self, portfolio_data) -> RiskMetrics:
-        returns = portfolio_data.get("returns", [])
+        New points of every token are compounded and averaged into one
+        equal-weighted portfolio return that is appended to portfolio_history.
+        """
+        token_returns = []
+        for token_id in token_ids:
+            ring = price_history.ring(token_id)
+            if ring is None:
+                continue
+            new_points = ring.total - self.portfolio_seen.get(token_id, ring.total - 1)
+            self.portfolio_seen[token_id] = ring.total
+            new_returns = ring.window("returns", new_points)
+            new_returns = new_returns[np.isfinite(new_returns)]
+            if len(new_returns):
+                token_returns.append(np.prod(1 + new_returns) - 1)
+
+        returns = []
+        if token_returns:
+            portfolio_return = float(np.mean(token_returns))
+            value = self.portfolio_history.last() or 1.0
+            self.portfolio_history.append(time.time(), value * (1 + portfolio_return))
+            returns.append(portfolio_return)
+        window = RISK_WINDOW or None
+        prices = {token_id: price_history.prices(token_id, window) for token_id in token_ids if price_history.ring(token_id)}
+        return {"returns": returns, "prices": prices}
+
+    def performance_risk_score(self, tokens, weights=scoring.RISK_WEIGHTS):
+        return scoring.performance_risk_score(tokens, weights)
+
+    def calculate_risk_metrics(self, portfolio_data, incremental=True) -> RiskMetrics:
+        """Risk metrics from the streaming accumulator.
+
+        By default `portfolio_data["returns"]` holds only the returns observed
+        since the previous call (what portfolio_data() produces); they are
+        pushed into the accumulator rather than re-scanned. Pass
+        incremental=False to give the full return history instead, as callers
+        did before the accumulator: it then replaces the accumulated state.
+        """
+        if not incremental:
+            with self.risk_accumulator.lock:
+                self.risk_accumulator.reset()
+        self.risk_accumulator.extend(portfolio_data.get("returns", []))
         prices = portfolio_data.get("prices", {})
 
-        var_95 = self.calculate_var(returns, 0.95)
-        sharpe_ratio = self.calculate_sharpe_ratio(returns)
-        volatility = self.calculate_volatility(returns)
-        max_drawdown = self.calculate_max_drawdown(returns)
+        stats = self.risk_accumulator.metrics()
+        var_95 = stats["var_95"]
+        sharpe_ratio = stats["sharpe_ratio"]
+        volatility = stats["volatility"]
+        max_drawdown = stats["max_drawdown"]
         correlation_matrix = self.calculate_correlation_matrix(prices)
         risk_level = self.determine_risk_level(var_95, volatility, max_drawdown)
 
@@ -523,77 +827,22 @@ class RiskAgent:
             risk_level=risk_level)
 
     def calculate_var(self, returns: list[float], confidence: float) -> float:
-        if not returns:
-            return 0.0
-        sorted_returns = sorted(returns)
-        index = int((1 - confidence) * len(sorted_returns))
-        return abs(sorted_returns[index]) if index < len(sorted_returns) else 0.0
+        return risk_stats.calculate_var(returns, confidence)
 
     def calculate_sharpe_ratio(self, returns: list[float]) -> float:
-        if not returns or len(returns) < 2:
-            return 0.0
-        avg_return = sum(returns) / len(returns)
-        variance = sum((r - avg_return) ** 2 for r in returns) / (len(returns) - 1)
-        std_dev = variance ** 0.5
-        return avg_return / std_dev if std_dev > 0 else 0.0
+        return risk_stats.calculate_sharpe_ratio(returns)
 
     def calculate_volatility(self, returns: list[float]) -> float:
-        if not returns or len(returns) < 2:
-            return 0.0
-        avg_return = sum(returns) / len(returns)
-        variance = sum((r - avg_return) ** 2 for r in returns) / (len(returns) - 1)
-        return variance ** 0.5
-
-
+        return risk_stats.calculate_volatility(returns)
 
     def calculate_max_drawdown(self, returns: list[float]) -> float:
-        if not returns:
-            return 0.0
-        cumulative = 1.0
-        peak = 1.0
-        max_dd = 0.0
-        for ret in returns:
-            cumulative *= (1 + ret)
-            if cumulative > peak:
-                peak = cumulative
-            drawdown = (peak - cumulative) / peak
-            max_dd = max(max_dd, drawdown)
-        return max_dd
-
-    def calculate_correlation_matrix(self, prices: dict[str, list[float]]) -> dict[str, dict[str, float]]:
-        if not prices:
-            return {}
-        tokens = list(prices.keys())
-        correlation_matrix = {}
-        for token1 in tokens:
-            correlation_matrix[token1] = {}
-            for token2 in tokens:
-                if token1 == token2:
-                    correlation_matrix[token1][token2] = 1.0
-                else:
-                    corr = self.calculate_correlation(prices[token1], prices[token2])
-                    correlation_matrix[token1][token2] = corr
-        return correlation_matrix
-
-    def calculate_correlation(self, prices1: list[float], prices2: list[float]) -> float:
-        if len(prices1) != len(prices2) or len(prices1) < 2:
-            return 0.0
-        returns1 = [(prices1[i] - prices1[i-1]) / prices1[i-1] for i in range(1, len(prices1))]
-        returns2 = [(prices2[i] - prices2[i-1]) / prices2[i-1] for i in range(1, len(prices2))]
-        if not returns1 or not returns2:
-            return 0.0
-        n = len(returns1)
-        mean1 = sum(returns1) / n
-        mean2 = sum(returns2) / n
-        numerator = sum((returns1[i] - mean1) * (returns2[i] - mean2) for i in range(n))
-        denominator1 = sum((returns1[i] - mean1) ** 2 for i in range(n)) ** 0.5
-        denominator2 = sum((returns2[i] - mean2) ** 2 for i in range(n)) ** 0.5
-        if denominator1 == 0 or denominator2 == 0:
-            return 0.0
-        return numerator / (denominator1 * denominator2)
-
+        return risk_stats.calculate_max_drawdown(returns)
 
+    def calculate_correlation_matrix(self, prices: dict[str, list[float]], window=None, halflife=None, min_periods=2) -> dict[str, dict[str, float]]:
+        return risk_stats.calculate_correlation_matrix(prices, window, halflife, min_periods)
 
+    def calculate_correlation(self, prices1: list[float], prices2: list[float]) -> float:
+        return risk_stats.calculate_correlation(prices1, prices2)
 
     def determine_risk_level(self, var: float, volatility: float, max_drawdown: float) -> str:
         risk_score = 0
@@ -684,34 +933,84 @@ class RiskAgent:
 
 # --- PORTFOLIO MANAGER (PM) AGENT ---
 class PMAgent:
+    def __init__(self):
+        self.consumer = "pm_agent"
+        self.insights = {}      # token -> latest research insight
+        self.risks = {}         # symbol -> latest risk metrics
+        self.state_loaded = False
+        mcp_register(self.consumer, ["market_data", "risk_metrics"], start="earliest")
+        mcp_register(self.consumer, ["risk_alert"])
+
+    def refresh_state(self):
+        """Fold unacknowledged insights/risk metrics into the per-token state.
+
+        Returns the new (seq, message) pairs per topic, including risk alerts.
+        After a restart the state is first rebuilt from the retained messages.
+        """
+        new = {}
+        for topic, state, key in (("market_data", self.insights, "token"), ("risk_metrics", self.risks, "symbol")):
+            if not self.state_loaded:
+                for _, message in mcp_read(topic):
+                    state[message.get(key)] = message
+            new[topic] = mcp_consume(self.consumer, topic)
+            for _, message in new[topic]:
+                state[message.get(key)] = message
+        new["risk_alert"] = mcp_consume(self.consumer, "risk_alert")
+        self.state_loaded = True
+        return new
+
+    def recent_rebalances(self, limit=5):
+        """Latest executed rebalances from the local event index (never scans the chain)"""
+        try:
+            return event_index.rebalances(limit=limit)
+        except Exception as e:
+            print(f"[PM Agent] Error reading rebalance history: {e}")
+            return []
+
     def make_decisions(self):
         print("[PM Agent] Making portfolio decisions using AI rebalancing...")
-        research_insights = mcp_subscribe("market_data")
-        risk_metrics = mcp_subscribe("risk_metrics")
-        risk_alerts = mcp_subscribe("risk_alert")
+        new = self.refresh_state()
+        # Unacknowledged messages are decided on again at the next run
+        if not self.decide(new):
+            return
+        for topic, messages in new.items():
+            if messages:
+                mcp_ack(self.consumer, topic, messages[-1][0])
+
+    def decide(self, new):
+        """Act on the new messages; False when no decision could be made"""
+        research_insights = list(self.insights.values())
+        risk_metrics = list(self.risks.values())
+        risk_alerts = [message for _, message in new["risk_alert"]]
+
+        if not any(new.values()):
+            print("[PM Agent] No new insights, risk metrics or alerts since the last decision.")
+            mcp_publish("pm_instructions",{"action": "No rebalance (HOLD)", "detail": "NO NEW INSIGHTS" })
+            return True
 
         # Emergency/Rebalance Rules
         if any(alert.get("severity") == "CRITICAL" for alert in risk_alerts):
             print("[PM Agent] CRITICAL risk alerts detected, holding position.")
             mcp_publish("pm_instructions",{"action": "Emergency rebalancing, convert all to stablecoin", "detail": "" })
             mcp_publish("emergency_rebalance",{"action": "Emergency rebalancing, convert all to stablecoin" })
-            return
+            return True
 
-        if risk_metrics:
-            latest_metrics = risk_metrics[-1]
+        if new["risk_metrics"]:
+            latest_metrics = new["risk_metrics"][-1][1]
             if latest_metrics.get('risk_level') in ["HIGH", "CRITICAL"]:
                 print(f"[PM Agent] Risk level {latest_metrics['risk_level']} - not rebalancing.")
                 mcp_publish("pm_instructions",{"action": "No rebalance (HOLD)", "detail": "HIGH VOLATILITY" })
-                return
+                return True
 
         print("PMAgent insights::: ", research_insights, risk_metrics, risk_alerts)
         if len(research_insights) == 0 or len(risk_metrics)  == 0:
             print("No insights, PMAgent make_decisions ")
             mcp_publish("pm_instructions",{"action": "No rebalance (HOLD)", "detail": "NO STRONG INSIGHTS" })
-            return
+            return True
 
         data = self.get_balances()
         assets = data['assets']
+        recent_rebalances = self.recent_rebalances()
 
         # Compose prompt for OpenAI
         prompt = f'''
@@ -804,6 +1103,10 @@ class PMAgent:
             
                     {json.dumps(risk_alerts, indent=2)}\n\n
 
+            Recent On-Chain Rebalances (already executed, newest first):
+
+                    {json.dumps(recent_rebalances, indent=2)}\n\n
+
             Output:
 
                         Return only the JSON object. No extra commentary.
@@ -826,7 +1129,7 @@ class PMAgent:
             if "null" in response_content.lower().strip():
                 print("[PM Agent] AI recommends no rebalance (HOLD).")
                 mcp_publish("pm_instructions",{"action": "No rebalance (HOLD)", "detail": "NOT STRONG SIGNALS" })
-                return
+                return True
 
             order_json = None
             try:
@@ -856,26 +1159,23 @@ class PMAgent:
         except Exception as e:
             print(f"[PM Agent] OpenAI error or parsing error: {e}")
             print(prompt)
+            return False
+        return True
 
     def get_balances(self):
         try:
             print("get_balances")
-            if not all([PROVIDER_URL, UNIPOOL_CONTRACT_ADDRESS, UNIPOOL_CONTRACT_ABI]):
-                return jsonify({"success": False, "error": "Contract/web3 config missing"}), 500
+            if not chain.configured:
+                return {"success": False, "error": "Contract/web3 config missing"}
 
-            w3 = Web3(Web3.HTTPProvider(PROVIDER_URL))
-            if not w3.is_connected():
-                return jsonify({"success": False, "error": "Web3 connection failed"}), 500
+            if not chain.ready():
+                return {"success": False, "error": "Web3 connection failed"}
 
-            contract = w3.eth.contract(
-                address=Web3.to_checksum_address(UNIPOOL_CONTRACT_ADDRESS),
-                abi=UNIPOOL_CONTRACT_ABI
-            )
-            addresses = contract.functions.portfolioAssetsList().call()
+            addresses = portfolio_state.get("portfolioAssetsList")
             pprint.pprint(addresses)
             result = [
                 {
-                    "address": w3.to_checksum_address(addr)
+                    "address": Web3.to_checksum_address(addr)
                 }
                 for addr in  addresses
             ]
@@ -897,7 +1197,8 @@ class PMAgent:
 # --- TRADER AGENT ---
 class TraderAgent:
     def __init__(self):
-        self.processed_orders = deque(maxlen=100)
+        self.consumer = "trader_agent"
+        mcp_register(self.consumer, ["emergency_rebalance", "trade_instructions"])
 
     def emergency_rebalance(self):
         """Emergency rebalancing to move to stablecoin"""
@@ -923,20 +1224,18 @@ class TraderAgent:
     def execute_trades(self):
         print("[Trader Agent] Checking for new trading instructions...")
 
-        emergency = mcp_subscribe("emergency_rebalance")
+        emergency = mcp_consume(self.consumer, "emergency_rebalance")
         if emergency:
             self.emergency_rebalance()
+            mcp_ack(self.consumer, "emergency_rebalance", emergency[-1][0])
             return
 
-        instructions = mcp_subscribe("trade_instructions")
+        # Only orders published since the last acknowledged one; older ones are superseded
+        instructions = mcp_consume(self.consumer, "trade_instructions")
         if not instructions: return
 
-        latest_order = instructions[-1]
+        seq, latest_order = instructions[-1]
 
-
-        order_id = latest_order["uuid"]
-        if order_id in self.processed_orders: return
-        
         print(f"[Trader Agent] New order received: {latest_order}")
         
         # Publish status update for the UI
@@ -955,28 +1254,23 @@ class TraderAgent:
             "tx_hash": tx_hash
         })
         print(f"[Trader Agent] Trade complete. TxHash: {tx_hash}")
-        self.processed_orders.append(order_id)
+        mcp_ack(self.consumer, "trade_instructions", seq)
 
 
     def get_balances(self):
         try:
             print("get_balances")
-            if not all([PROVIDER_URL, UNIPOOL_CONTRACT_ADDRESS, UNIPOOL_CONTRACT_ABI]):
-                return jsonify({"success": False, "error": "Contract/web3 config missing"}), 500
+            if not chain.configured:
+                return {"success": False, "error": "Contract/web3 config missing"}
 
-            w3 = Web3(Web3.HTTPProvider(PROVIDER_URL))
-            if not w3.is_connected():
-                return jsonify({"success": False, "error": "Web3 connection failed"}), 500
+            if not chain.ready():
+                return {"success": False, "error": "Web3 connection failed"}
 
-            contract = w3.eth.contract(
-                address=Web3.to_checksum_address(UNIPOOL_CONTRACT_ADDRESS),
-                abi=UNIPOOL_CONTRACT_ABI
-            )
-            addresses = contract.functions.portfolioAssetsList().call()
+            addresses = portfolio_state.get("portfolioAssetsList")
             pprint.pprint(addresses)
             result = [
                 {
-                    "address": w3.to_checksum_address(addr)
+                    "address": Web3.to_checksum_address(addr)
                 }
                 for addr in  addresses
             ]
@@ -1006,6 +1300,7 @@ if __name__ == "__main__":
     
     agent_thread = threading.Thread(target=run_mcp_server, args=[], daemon=True)
     agent_thread.start()
+    event_index.start()
     def job():
         print("I'm working...")
  
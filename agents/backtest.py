@@ -0,0 +1,229 @@
+"""Offline backtest of the Research -> Risk -> PM pipeline on market snapshots.
+
+Snapshots are long-format CSV or Parquet files, one row per token per
+snapshot. Required columns: timestamp (epoch seconds or ISO 8601), id,
+price. Optional columns, defaulting like the live scoring does:
+market_cap, volume_24h (or total_volume), volume_change_24h,
+price_change_1h/24h/7d/14d, news_sentiment, social_sentiment.
+
+Usage:
+    python backtest.py snapshots.csv [--initial TOKEN ...] [--capital USD]
+"""
+import argparse
+import csv
+import time
+
+import numpy as np
+
+from scoring import comprehensive_score_matrix, performance_risk_matrix, RISK_HORIZONS
+from MarketAndNewsDataMCP import PriceHistory
+
+
+SNAPSHOT_FIELDS = {
+    "price": np.nan,
+    "market_cap": 0.0,
+    "volume_24h": 0.0,
+    "volume_change_24h": 0.0,
+    "price_change_1h": 0.0,
+    "price_change_24h": 0.0,
+    "price_change_7d": 0.0,
+    "price_change_14d": 0.0,
+    "news_sentiment": 50.0,
+    "social_sentiment": 50.0,
+}
+
+
+class MarketSnapshots():
+    """Snapshots as (T snapshots x N tokens) float64 arrays, NaN where a token is missing"""
+    def __init__(self, timestamps, token_ids, fields):
+        self.timestamps = timestamps
+        self.token_ids = token_ids
+        self.fields = fields
+
+    @classmethod
+    def from_rows(cls, rows):
+        rows = list(rows)
+        timestamps = sorted({row["timestamp"] for row in rows})
+        token_ids = sorted({row["id"] for row in rows})
+        t_index = {ts: i for i, ts in enumerate(timestamps)}
+        n_index = {token_id: j for j, token_id in enumerate(token_ids)}
+        t = np.array([t_index[row["timestamp"]] for row in rows], dtype=np.intp)
+        n = np.array([n_index[row["id"]] for row in rows], dtype=np.intp)
+        present = np.zeros((len(timestamps), len(token_ids)), dtype=bool)
+        present[t, n] = True
+
+        fields = {}
+        for field, default in SNAPSHOT_FIELDS.items():
+            matrix = np.full(present.shape, np.nan)
+            matrix[present] = default
+            values = np.array([row.get(field, default) for row in rows], dtype=np.float64)
+            matrix[t, n] = np.where(np.isnan(values), default, values)
+            fields[field] = matrix
+        return cls(np.array(timestamps, dtype=np.float64), token_ids, fields)
+
+    @classmethod
+    def load(cls, path):
+        if path.endswith(".parquet"):
+            try:
+                import pandas as pd
+            except ImportError:
+                raise ImportError("Reading Parquet snapshots needs pandas and pyarrow installed")
+            records = pd.read_parquet(path).to_dict("records")
+        else:
+            with open(path, newline="") as f:
+                records = list(csv.DictReader(f))
+        return cls.from_rows(cls.parse_row(record) for record in records)
+
+    @staticmethod
+    def parse_row(record):
+        row = {"id": str(record["id"])}
+        timestamp = record["timestamp"]
+        try:
+            row["timestamp"] = float(timestamp)
+        except (TypeError, ValueError):
+            row["timestamp"] = PriceHistory.timestamp(str(timestamp))
+        if "volume_24h" not in record and "total_volume" in record:
+            record = dict(record, volume_24h=record["total_volume"])
+        for field in SNAPSHOT_FIELDS:
+            value = record.get(field)
+            if value not in (None, ""):
+                row[field] = float(value)
+        return row
+
+
+class BacktestResult():
+    def __init__(self, timestamps, equity, turnover, rebalances, trades, cycles_per_second):
+        self.timestamps = timestamps
+        self.equity = equity
+        self.turnover = turnover
+        self.rebalances = rebalances
+        self.trades = trades
+        self.cycles_per_second = cycles_per_second
+
+    def to_dict(self):
+        start, end = float(self.equity[0]), float(self.equity[-1])
+        peak = np.maximum.accumulate(self.equity)
+        return {
+            "cycles": len(self.equity),
+            "start_value": start,
+            "end_value": end,
+            "pnl": end - start,
+            "return": end / start - 1 if start else 0.0,
+            "max_drawdown": float(((peak - self.equity) / peak).max()),
+            "turnover": float(self.turnover.sum() / self.equity.mean()),
+            "traded_value": float(self.turnover.sum()),
+            "rebalances": self.rebalances,
+            "trades": self.trades,
+            "cycles_per_second": self.cycles_per_second
+        }
+
+
+class Backtester():
+    """Replays snapshots through the research/risk scoring and the PM rebalancing rules.
+
+    Scores and risk are computed for every snapshot at once; only the
+    portfolio walk is sequential. Each cycle follows PMAgent's rules: sell
+    `sell_bps` of every held asset whose RiskScore is above `sell_risk`, then
+    spend the stable balance on assets not held with a BUY recommendation
+    and RiskScore at most `buy_risk`, split into equal bps. Orders execute
+    like UnipoolInvestment.rebalance: sells are bps of the asset balance,
+    buys are bps of the stable balance measured after the sells, and every
+    swap pays `fee_bps` (the 0.3% pool fee by default).
+    """
+    def __init__(self, sell_risk=0.9, sell_bps=5000, buy_risk=0.5, fee_bps=30):
+        self.sell_risk = sell_risk
+        self.sell_bps = sell_bps
+        self.buy_risk = buy_risk
+        self.fee_bps = fee_bps
+
+    def signals(self, snapshots):
+        """(score, recommendation, RiskScore) arrays for every snapshot and token"""
+        fields = snapshots.fields
+        score, recommendation = comprehensive_score_matrix(fields)
+        changes = np.stack([np.nan_to_num(fields[key]) for key in RISK_HORIZONS], axis=-1)
+        changes[np.isnan(fields["price"])] = np.nan
+        _, risk_score = performance_risk_matrix(changes)
+        return score, recommendation, risk_score
+
+    def run(self, snapshots, capital=10000.0, initial=None):
+        """Walk the portfolio through the snapshots, starting from `capital` in stable.
+
+        `initial` lists token ids bought in equal parts on the first snapshot
+        (all tokens priced there when None); an empty list starts in stable.
+        """
+        start = time.perf_counter()
+        _, recommendation, risk_score = self.signals(snapshots)
+        prices = snapshots.fields["price"]
+        tradable = ~np.isnan(prices)
+        marks = np.nan_to_num(self.forward_fill(prices))
+        buy_ok = (recommendation == 1) & (risk_score <= self.buy_risk) & tradable
+        sell_ok = (risk_score > self.sell_risk) & tradable
+        fee = 1 - self.fee_bps / 10000
+        sell_fraction = self.sell_bps / 10000
+
+        T, N = prices.shape
+        units = np.zeros(N)
+        stable = float(capital)
+        if initial is None:
+            targets = tradable[0]
+        else:
+            targets = np.isin(snapshots.token_ids, initial) & tradable[0]
+        if targets.any():
+            spend = stable / targets.sum()
+            units[targets] = spend * fee / prices[0, targets]
+            stable -= spend * targets.sum()
+
+        equity = np.empty(T)
+        turnover = np.zeros(T)
+        rebalances = trades = 0
+        for t in range(T):
+            held = units > 0
+            sell = held & sell_ok[t]
+            # Like the PM prompt: no sell condition means no order at all
+            if sell.any():
+                price = prices[t]
+                sold = units[sell] * sell_fraction
+                units[sell] -= sold
+                proceeds = sold * price[sell]
+                stable += proceeds.sum() * fee
+                buy = ~held & buy_ok[t]
+                n_buys = int(buy.sum())
+                spent = 0.0
+                if n_buys:
+                    bps = 10000 // n_buys
+                    amount = stable * bps / 10000
+                    units[buy] += amount * fee / price[buy]
+                    spent = amount * n_buys
+                    stable -= spent
+                turnover[t] = proceeds.sum() + spent
+                rebalances += 1
+                trades += int(sell.sum()) + n_buys
+            equity[t] = stable + np.dot(units, marks[t])
+
+        elapsed = time.perf_counter() - start
+        return BacktestResult(snapshots.timestamps, equity, turnover, rebalances, trades,
+                              T / elapsed if elapsed > 0 else float("inf"))
+
+    @staticmethod
+    def forward_fill(prices):
+        """Last known price for every token, so missing snapshots are marked, not zeroed"""
+        index = np.where(np.isnan(prices), 0, np.arange(len(prices))[:, None])
+        np.maximum.accumulate(index, axis=0, out=index)
+        return prices[index, np.arange(prices.shape[1])]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("snapshots")
+    parser.add_argument("--capital", type=float, default=10000.0)
+    parser.add_argument("--initial", nargs="*", help="token ids held at the start (default: all)")
+    parser.add_argument("--sell-risk", type=float, default=0.9)
+    parser.add_argument("--sell-bps", type=int, default=5000)
+    parser.add_argument("--buy-risk", type=float, default=0.5)
+    parser.add_argument("--fee-bps", type=float, default=30)
+    args = parser.parse_args()
+
+    backtester = Backtester(args.sell_risk, args.sell_bps, args.buy_risk, args.fee_bps)
+    result = backtester.run(MarketSnapshots.load(args.snapshots), args.capital, args.initial)
+    for key, value in result.to_dict().items():
+        print(f"{key + ':':20}{value}")
@@ -0,0 +1,340 @@
+"""Micro-benchmarks for the agents' hot paths.
+
+Usage:
+    python benchmarks.py sentiment [--size N]
+    python benchmarks.py risk [--size N]
+    python benchmarks.py correlation [--size N]
+    python benchmarks.py streaming [--size N]
+    python benchmarks.py backtest [--size N]
+    python benchmarks.py publish [--size N]
+    python benchmarks.py wait [--size N]
+
+--size defaults to DEFAULT_SIZES[benchmark].
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+from textblob import TextBlob
+
+from MarketAndNewsDataMCP import BatchSentimentEngine, pattern_sentiment
+
+
+FILLER = (
+    "bitcoin ethereum price market crypto token analysts investors the a of to in is "
+    "on for with as ETF SEC Mr. U.S. $BTC #crypto (2024) 10,000 , , . ? “said” it's"
+).split()
+
+
+def make_texts(size, seed=42):
+    """Synthetic headline-like texts mixing lexicon words and filler"""
+    rng = random.Random(seed)
+    lexicon = list(pattern_sentiment.keys())
+    texts = []
+    for _ in range(size):
+        words = [rng.choice(lexicon) if rng.random() < 0.3 else rng.choice(FILLER) for _ in range(rng.randint(8, 40))]
+        texts.append(" ".join(words).capitalize() + rng.choice([".", ".", "?"]))
+    return texts
+
+
+# Default --size per benchmark; the correlation reference loop is O(N^2 * T)
+DEFAULT_SIZES = {"sentiment": 20000, "risk": 20000, "correlation": 60, "streaming": 20000,
+                 "backtest": 20000, "publish": 20000, "wait": 2000}
+
+
+def bench_sentiment(size):
+    texts = make_texts(size)
+    engine = BatchSentimentEngine()
+
+    start = time.perf_counter()
+    reference = [TextBlob(text).sentiment.polarity for text in texts]
+    textblob_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = engine.polarities(texts)
+    batch_time = time.perf_counter() - start
+
+    max_diff = max(abs(a - b) for a, b in zip(reference, batch))
+    print(f"texts:            {size}")
+    print(f"TextBlob:         {size / textblob_time:10.0f} texts/s")
+    print(f"Batch engine:     {size / batch_time:10.0f} texts/s ({textblob_time / batch_time:.1f}x)")
+    print(f"TextBlob fallback {engine.fallback_texts / size:10.1%} of texts")
+    print(f"max |diff|:       {max_diff:.2e}")
+
+
+def legacy_performance_risk_score(tokens, weights=(0.6, 0.3, 0.05, 0.05)):
+    """The per-token loop RiskAgent.performance_risk_score used to run"""
+    results = []
+    weights_arr = np.array(weights)
+    for token in tokens:
+        changes = np.array([
+            token["price_change_1h"],
+            token["price_change_24h"],
+            token["price_change_7d"],
+            token["price_change_14d"]
+        ])
+        factors = np.where(changes < 0, 1 + np.abs(changes)*2 / 100, 1 / (1 + changes*2 / 100))
+        penalized_changes = changes * factors
+        mean = np.average(penalized_changes, weights=weights_arr)
+        var = np.average((penalized_changes - mean) ** 2, weights=weights_arr)
+        results.append({"symbol": token["id"], "std_risk": float(np.sqrt(var))})
+    std_values = [r["std_risk"] for r in results]
+    min_val, max_val = min(std_values), max(std_values)
+    for r in results:
+        r["RiskScore"] = float((r["std_risk"] - min_val) / (max_val - min_val)) if max_val != min_val else 0.0
+    results.sort(key=lambda x: x["RiskScore"], reverse=True)
+    return results
+
+
+def bench_risk(size):
+    from scoring import performance_risk_score, performance_risk_matrix
+
+    rng = np.random.default_rng(42)
+    changes = rng.normal(0, [1, 4, 10, 15], size=(size, 4)).round(4)
+    tokens = [
+        {
+            "id": f"token-{i}",
+            "price_change_1h": row[0],
+            "price_change_24h": row[1],
+            "price_change_7d": row[2],
+            "price_change_14d": row[3],
+        }
+        for i, row in enumerate(changes.tolist())
+    ]
+
+    start = time.perf_counter()
+    reference = legacy_performance_risk_score(tokens)
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectorized = performance_risk_score(tokens)
+    vector_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    performance_risk_matrix(changes)
+    matrix_time = time.perf_counter() - start
+
+    print(f"tokens:           {size}")
+    print(f"per-token loop:   {loop_time * 1000:10.1f} ms")
+    print(f"vectorized:       {vector_time * 1000:10.1f} ms ({loop_time / vector_time:.1f}x)")
+    print(f"matrix only:      {matrix_time * 1000:10.1f} ms")
+    print(f"identical:        {reference == vectorized}")
+
+
+def bench_correlation(size, length=200):
+    from risk_stats import calculate_correlation, calculate_correlation_matrix
+
+    rng = np.random.default_rng(42)
+    paths = 100 * np.cumprod(1 + rng.normal(0, 0.02, size=(length, size)), axis=0)
+    prices = {f"token-{i}": paths[:, i].tolist() for i in range(size)}
+
+    start = time.perf_counter()
+    reference = {
+        a: {b: 1.0 if a == b else calculate_correlation(prices[a], prices[b]) for b in prices}
+        for a in prices
+    }
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matrix = calculate_correlation_matrix(prices)
+    matrix_time = time.perf_counter() - start
+
+    max_diff = max(abs(reference[a][b] - matrix[a][b]) for a in prices for b in prices)
+    print(f"tokens x points:  {size} x {length}")
+    print(f"pairwise loop:    {loop_time * 1000:10.1f} ms")
+    print(f"matrix engine:    {matrix_time * 1000:10.1f} ms ({loop_time / matrix_time:.1f}x)")
+    print(f"max |diff|:       {max_diff:.2e}")
+
+
+def bench_streaming(size, window=1440):
+    from risk_stats import (RiskAccumulator, calculate_var, calculate_sharpe_ratio, calculate_volatility,
+                            calculate_max_drawdown)
+
+    rng = np.random.default_rng(42)
+    returns = rng.normal(0.0005, 0.02, size).tolist()
+
+    start = time.perf_counter()
+    for i in range(len(returns)):
+        history = returns[max(0, i + 1 - window):i + 1]
+        reference = (calculate_var(history, 0.95), calculate_sharpe_ratio(history),
+                     calculate_volatility(history), calculate_max_drawdown(history))
+    rescan_time = time.perf_counter() - start
+
+    accumulator = RiskAccumulator(window=window)
+    start = time.perf_counter()
+    for ret in returns:
+        accumulator.update(ret)
+        stats = accumulator.metrics()
+    stream_time = time.perf_counter() - start
+
+    streamed = (stats["var_95"], stats["sharpe_ratio"], stats["volatility"], stats["max_drawdown"])
+    max_diff = max(abs(a - b) for a, b in zip(reference, streamed))
+    print(f"returns / window: {size} / {window}")
+    print(f"re-scan per tick: {rescan_time * 1000:10.1f} ms")
+    print(f"accumulator:      {stream_time * 1000:10.1f} ms ({rescan_time / stream_time:.1f}x)")
+    print(f"max |diff|:       {max_diff:.2e}")
+
+
+def make_snapshots(size, tokens=20, seed=42):
+    """Random-walk market snapshots for `size` cycles of `tokens` tokens"""
+    from backtest import MarketSnapshots
+
+    rng = np.random.default_rng(seed)
+    log_returns = rng.normal(0, 0.01, size=(size, tokens))
+    prices = 100 * np.exp(np.cumsum(log_returns, axis=0))
+
+    def change(lag):
+        past = np.vstack([np.repeat(prices[:1], lag, axis=0), prices[:-lag]])
+        return (prices / past - 1) * 100
+
+    fields = {
+        "price": prices,
+        "market_cap": prices * 1e6,
+        "volume_24h": prices * rng.uniform(1e3, 1e5, size=(size, tokens)),
+        "volume_change_24h": rng.normal(0, 10, size=(size, tokens)),
+        "price_change_1h": change(1),
+        "price_change_24h": change(24),
+        "price_change_7d": change(168),
+        "price_change_14d": change(336),
+        "news_sentiment": rng.uniform(20, 80, size=(size, tokens)),
+        "social_sentiment": rng.uniform(20, 80, size=(size, tokens)),
+    }
+    return MarketSnapshots(np.arange(size) * 3600.0, [f"token-{j}" for j in range(tokens)], fields)
+
+
+def legacy_comprehensive_score(market, news_score, social_score):
+    """The scalar ResearchAgent scoring the agents used before it was vectorized"""
+    price_change = market.get("price_change_24h", 0)
+    volume_change = market.get("volume_change_24h", 0)
+    technical = 50
+    if price_change > 0:
+        technical += min(price_change * 2, 30)
+    else:
+        technical += max(price_change * 2, -30)
+    if volume_change > 0 and price_change > 0:
+        technical += min(volume_change, 20)
+    technical = max(0, min(100, technical))
+    market_cap = market.get("market_cap", 0)
+    liquidity_ratio = market.get("volume_24h", 0) / market_cap if market_cap > 0 else 0
+    market_score = min(liquidity_ratio * 1000, 50)
+    return max(0, min(100, technical * 0.6 + news_score * 0.2 + social_score * 0.19 + market_score * 0.01))
+
+
+def bench_backtest(size):
+    from scoring import comprehensive_score_matrix
+    from backtest import Backtester
+
+    snapshots = make_snapshots(size)
+    backtester = Backtester()
+    result = backtester.run(snapshots, initial=snapshots.token_ids[:5])
+
+    # The vectorized scores must match the original per-token scoring
+    score, _ = comprehensive_score_matrix(snapshots.fields)
+    max_diff = 0.0
+    for t in range(0, size, max(1, size // 200)):
+        for j in range(len(snapshots.token_ids)):
+            market = {key: snapshots.fields[key][t, j] for key in ("price_change_24h", "volume_change_24h", "market_cap", "volume_24h")}
+            reference = legacy_comprehensive_score(market, snapshots.fields["news_sentiment"][t, j],
+                                                   snapshots.fields["social_sentiment"][t, j])
+            max_diff = max(max_diff, abs(reference - score[t, j]))
+
+    print(f"cycles x tokens:  {size} x {len(snapshots.token_ids)}")
+    for key, value in result.to_dict().items():
+        print(f"{key + ':':18}{value}")
+    print(f"score max |diff|: {max_diff:.2e}")
+
+
+def bench_publish(size):
+    import tempfile
+    from collections import deque
+    from pickledb import PickleDB
+    from message_log import MessageLog, MESSAGE_QUEUE_SIZE
+
+    message = {"token": "bitcoin", "score": 61.5, "sentiment": "BULLISH", "confidence": 0.8,
+               "key_factors": ["Strong price momentum"], "recommendation": "BUY"}
+    with tempfile.TemporaryDirectory() as directory:
+        db = PickleDB(f"{directory}/queues.db")
+        queue = deque(maxlen=MESSAGE_QUEUE_SIZE)
+        start = time.perf_counter()
+        for _ in range(size):
+            queue.append(message)
+            db.set("market_data", list(queue))
+            db.save()
+        pickledb_time = time.perf_counter() - start
+
+        log = MessageLog(f"{directory}/log")
+        log.recover()
+        start = time.perf_counter()
+        for _ in range(size):
+            log.append("market_data", message)
+        log.sync()
+        log_time = time.perf_counter() - start
+        log.close()
+
+    print(f"messages:         {size}")
+    print(f"PickleDB rewrite: {size / pickledb_time:10.0f} msg/s")
+    print(f"message log:      {size / log_time:10.0f} msg/s ({pickledb_time / log_time:.1f}x)")
+
+
+def bench_wait(size, interval=0.001, poll_interval=0.05):
+    """Publish-to-consumer latency of MessageLog.wait() against polling read()"""
+    import tempfile
+    import threading
+    from message_log import MessageLog
+
+    def consume(log, block, latencies):
+        cursor = -1
+        while cursor < size - 1:
+            if block:
+                log.wait(["bench"], {"bench": cursor}, timeout=1)
+            else:
+                time.sleep(poll_interval)
+            now = time.perf_counter()
+            for seq, message in log.read("bench", cursor):
+                latencies.append(now - message["sent"])
+                cursor = seq
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, block in (("polling", False), ("wait", True)):
+            log = MessageLog(f"{directory}/{name}", fsync_interval=0)
+            log.recover()
+            latencies = []
+            consumer = threading.Thread(target=consume, args=(log, block, latencies))
+            consumer.start()
+            for _ in range(size):
+                log.append("bench", {"sent": time.perf_counter()})
+                time.sleep(interval)
+            consumer.join()
+            log.close()
+            results[name] = latencies
+
+    print(f"messages:         {size} every {interval * 1000:.1f} ms")
+    print(f"poll every {poll_interval * 1000:.0f} ms: {1000 * np.mean(results['polling']):8.3f} ms avg latency, "
+          f"{len(results['polling'])} received")
+    print(f"wait():           {1000 * np.mean(results['wait']):8.3f} ms avg latency, "
+          f"{len(results['wait'])} received")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("benchmark", choices=["sentiment", "risk", "correlation", "streaming", "backtest", "publish", "wait"])
+    parser.add_argument("--size", type=int, default=None)
+    args = parser.parse_args()
+    args.size = args.size or DEFAULT_SIZES[args.benchmark]
+
+    if args.benchmark == "sentiment":
+        bench_sentiment(args.size)
+    elif args.benchmark == "risk":
+        bench_risk(args.size)
+    elif args.benchmark == "correlation":
+        bench_correlation(args.size)
+    elif args.benchmark == "streaming":
+        bench_streaming(args.size)
+    elif args.benchmark == "backtest":
+        bench_backtest(args.size)
+    elif args.benchmark == "publish":
+        bench_publish(args.size)
+    elif args.benchmark == "wait":
+        bench_wait(args.size)
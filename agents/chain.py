@@ -0,0 +1,463 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from eth_abi import decode
+from eth_utils.abi import abi_to_signature, function_signature_to_4byte_selector, get_abi_output_types
+from web3 import Web3
+from web3._utils.abi import map_abi_data
+from web3._utils.normalizers import BASE_RETURN_NORMALIZERS
+
+logger = logging.getLogger(__name__)
+
+CHAIN_HEALTH_INTERVAL = float(os.getenv("CHAIN_HEALTH_INTERVAL", 15))  # seconds between background node checks
+CHAIN_POOL_SIZE = int(os.getenv("CHAIN_POOL_SIZE", 8))  # keep-alive connections to the provider
+CHAIN_REQUEST_TIMEOUT = float(os.getenv("CHAIN_REQUEST_TIMEOUT", 30))
+CHAIN_BLOCK_MAX_AGE = float(os.getenv("CHAIN_BLOCK_MAX_AGE", 1.0))  # seconds a known block number is trusted
+MULTICALL3_ADDRESS = os.getenv("MULTICALL3_ADDRESS", "0xcA11bde05977b3631167028862bE2a173976CA11")
+MULTICALL_BATCH_SIZE = int(os.getenv("MULTICALL_BATCH_SIZE", 500))  # calls per aggregate3 eth_call
+VALUATION_CACHE_SIZE = 16  # (block, users) valuations kept by PortfolioState
+
+MULTICALL3_ABI = [{
+    "type": "function", "name": "aggregate3", "stateMutability": "payable",
+    "inputs": [{"name": "calls", "type": "tuple[]", "components": [
+        {"name": "target", "type": "address"},
+        {"name": "allowFailure", "type": "bool"},
+        {"name": "callData", "type": "bytes"}]}],
+    "outputs": [{"name": "returnData", "type": "tuple[]", "components": [
+        {"name": "success", "type": "bool"},
+        {"name": "returnData", "type": "bytes"}]}]
+}]
+
+# The UnipoolOracle reads the agents use, with its custom errors for revert decoding
+UNIPOOL_ORACLE_ABI = [
+    {"type": "function", "name": "getPrice", "stateMutability": "view",
+     "inputs": [{"name": "token", "type": "address"}],
+     "outputs": [{"name": "price", "type": "uint256"}]},
+    {"type": "function", "name": "getPriceInfo", "stateMutability": "view",
+     "inputs": [{"name": "token", "type": "address"}],
+     "outputs": [{"name": "price", "type": "uint256"}, {"name": "lastUpdated", "type": "uint256"},
+                 {"name": "isActive", "type": "bool"}, {"name": "isExpired", "type": "bool"}]},
+    {"type": "error", "name": "TokenNotFound", "inputs": [{"name": "token", "type": "address"}]},
+    {"type": "error", "name": "TokenNotActive", "inputs": [{"name": "token", "type": "address"}]},
+    {"type": "error", "name": "PriceExpired", "inputs": [{"name": "token", "type": "address"}, {"name": "lastUpdated", "type": "uint256"}]},
+]
+
+# Solidity's built-in revert payloads
+BUILTIN_ERRORS = [
+    {"type": "error", "name": "Error", "inputs": [{"name": "message", "type": "string"}]},
+    {"type": "error", "name": "Panic", "inputs": [{"name": "code", "type": "uint256"}]},
+]
+
+
+class ChainClient():
+    """Process-wide access to the provider: one Web3 instance over a pooled
+    keep-alive session, cached contract objects and chain id, and a node
+    health check that runs in a background thread instead of per request.
+
+    Point `provider_url` at a local anvil node (http://127.0.0.1:8545) to
+    exercise it end to end.
+    """
+
+    def __init__(self, provider_url: Optional[str], contract_address: Optional[str] = None,
+                 abi: Optional[Any] = None, health_interval: float = CHAIN_HEALTH_INTERVAL):
+        self.provider_url = provider_url
+        self.contract_address = contract_address
+        self.abi = abi
+        self.health_interval = health_interval
+        self.lock = threading.Lock()
+        self._w3 = None
+        self._chain_id = None
+        self.contracts: Dict[Any, Any] = {}
+        self.accounts: Dict[str, Any] = {}
+        self.healthy = None          # None until the first check has run
+        self.block_number = None
+        self.block_seen_at = 0.0
+        self.last_check = None
+        self.last_error = None
+        self.checks = 0
+        self.failures = 0
+        self.health_thread = None
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.provider_url and self.contract_address and self.abi)
+
+    @property
+    def w3(self) -> Web3:
+        if self._w3 is None:
+            with self.lock:
+                if self._w3 is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=CHAIN_POOL_SIZE)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    # web3 re-asks eth_chainId around calls; let the provider answer that from memory
+                    provider = Web3.HTTPProvider(
+                        self.provider_url, request_kwargs={"timeout": CHAIN_REQUEST_TIMEOUT}, session=session,
+                        cache_allowed_requests=True, cacheable_requests={"eth_chainId", "net_version", "web3_clientVersion"})
+                    self._w3 = Web3(provider)
+        return self._w3
+
+    @property
+    def chain_id(self) -> int:
+        if self._chain_id is None:
+            self._chain_id = self.w3.eth.chain_id
+        return self._chain_id
+
+    def contract(self, address: Optional[str] = None, abi: Optional[Any] = None):
+        """Contract object for `address` (the Unipool contract by default), built once"""
+        address = Web3.to_checksum_address(address or self.contract_address)
+        abi = abi if abi is not None else self.abi
+        key = (address, id(abi))
+        contract = self.contracts.get(key)
+        if contract is None:
+            contract = self.contracts[key] = self.w3.eth.contract(address=address, abi=abi)
+        return contract
+
+    def account(self, private_key: str):
+        account = self.accounts.get(private_key)
+        if account is None:
+            account = self.accounts[private_key] = self.w3.eth.account.from_key(private_key)
+        return account
+
+    def check_health(self) -> bool:
+        """One node round trip (eth_blockNumber); updates the cached health status"""
+        self.checks += 1
+        try:
+            self.observe_block(self.w3.eth.block_number)
+            self.healthy = True
+            self.last_error = None
+        except Exception as e:
+            self.healthy = False
+            self.failures += 1
+            self.last_error = str(e)
+            logger.warning(f"Chain provider health check failed: {e}")
+        self.last_check = time.time()
+        return self.healthy
+
+    def observe_block(self, block_number: int) -> None:
+        """Record a block number seen on chain (head poll or a mined receipt)"""
+        with self.lock:
+            if self.block_number is None or block_number >= self.block_number:
+                self.block_number = block_number
+                self.block_seen_at = time.monotonic()
+
+    def latest_block(self, max_age: float = CHAIN_BLOCK_MAX_AGE) -> int:
+        """Head block number, asking the node at most once per `max_age` seconds"""
+        if self.block_number is None or time.monotonic() - self.block_seen_at > max_age:
+            self.observe_block(self.w3.eth.block_number)
+        return self.block_number
+
+    def ready(self) -> bool:
+        """Cached health status; only the very first call waits for a check"""
+        if not self.provider_url:
+            return False
+        self.start()
+        if self.healthy is None:
+            return self.check_health()
+        return self.healthy
+
+    def start(self) -> None:
+        if self.health_thread is None and self.health_interval > 0:
+            with self.lock:
+                if self.health_thread is None:
+                    self.health_thread = threading.Thread(target=self.run_health_checks, name="chain-health", daemon=True)
+                    self.health_thread.start()
+
+    def run_health_checks(self) -> None:
+        while True:
+            time.sleep(self.health_interval)
+            self.check_health()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "configured": self.configured,
+            "healthy": self.healthy,
+            "block_number": self.block_number,
+            "chain_id": self._chain_id,
+            "last_check": self.last_check,
+            "last_error": self.last_error,
+            "checks": self.checks,
+            "failures": self.failures,
+            "contracts": len(self.contracts)
+        }
+
+
+class CallResult():
+    """Outcome of one call inside a multicall: a decoded value or a decoded revert"""
+    def __init__(self, success, value=None, error=None, error_args=None):
+        self.success = success
+        self.value = value
+        self.error = error
+        self.error_args = error_args
+
+    def to_dict(self):
+        if self.success:
+            return {"success": True, "value": self.value}
+        return {"success": False, "error": self.error, "error_args": self.error_args}
+
+
+class Multicall():
+    """Batches contract reads into Multicall3.aggregate3 eth_calls.
+
+    Each call may fail on its own (allowFailure): its revert data is decoded
+    against the custom errors in the target contract's ABI (e.g. the
+    oracle's PriceExpired) plus Error(string)/Panic(uint256). Up to
+    MULTICALL_BATCH_SIZE calls go into one round trip.
+    """
+
+    def __init__(self, chain: ChainClient, address: str = MULTICALL3_ADDRESS, batch_size: int = MULTICALL_BATCH_SIZE):
+        self.chain = chain
+        self.address = address
+        self.batch_size = batch_size
+        self.available = None
+        self.round_trips = 0
+        self.calls = 0
+        self.failures = 0
+        self.error_selectors: Dict[bytes, Dict[str, Any]] = {}
+        self.register_errors(BUILTIN_ERRORS)
+
+    def register_errors(self, abi) -> None:
+        for item in abi:
+            if item.get("type") == "error":
+                self.error_selectors[function_signature_to_4byte_selector(abi_to_signature(item))] = item
+
+    def is_available(self) -> bool:
+        """Whether Multicall3 is deployed on this chain (checked once)"""
+        if self.available is None:
+            self.available = len(self.chain.w3.eth.get_code(Web3.to_checksum_address(self.address))) > 0
+        return self.available
+
+    def decode_value(self, function, data: bytes):
+        output_types = get_abi_output_types(function.abi)
+        values = map_abi_data(BASE_RETURN_NORMALIZERS, output_types, decode(output_types, data))
+        return values[0] if len(values) == 1 else list(values)
+
+    def decode_error(self, data: bytes) -> CallResult:
+        item = self.error_selectors.get(bytes(data[:4]))
+        if item is None:
+            return CallResult(False, error="0x" + bytes(data[:4]).hex() if data else "Reverted")
+        types = [arg["type"] for arg in item["inputs"]]
+        try:
+            args = map_abi_data(BASE_RETURN_NORMALIZERS, types, decode(types, bytes(data[4:])))
+        except Exception:
+            args = None
+        names = [arg["name"] for arg in item["inputs"]]
+        return CallResult(False, error=item["name"], error_args=dict(zip(names, args)) if args is not None else None)
+
+    def call(self, functions, block_identifier="latest") -> List[CallResult]:
+        """Run bound contract functions (contract.functions.x(args)) in as few eth_calls as possible"""
+        for function in functions:
+            self.register_errors(function.contract_abi)
+        multicall = self.chain.contract(self.address, MULTICALL3_ABI)
+        results = []
+        for start in range(0, len(functions), self.batch_size):
+            batch = functions[start:start + self.batch_size]
+            payload = [(function.address, True, function._encode_transaction_data()) for function in batch]
+            self.round_trips += 1
+            self.calls += len(batch)
+            for function, (success, data) in zip(batch, multicall.functions.aggregate3(payload).call(block_identifier=block_identifier)):
+                if success:
+                    try:
+                        results.append(CallResult(True, self.decode_value(function, data)))
+                        continue
+                    except Exception as e:
+                        result = CallResult(False, error=f"Undecodable return data: {e}")
+                else:
+                    result = self.decode_error(data)
+                self.failures += 1
+                results.append(result)
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "address": self.address,
+            "available": self.available,
+            "round_trips": self.round_trips,
+            "calls": self.calls,
+            "failures": self.failures
+        }
+
+
+class PortfolioState():
+    """Unipool view reads cached per block number.
+
+    Every read is made at an explicit block, so values read at the same
+    block are consistent, and is reused until the chain moves to a newer
+    block or one of our own transactions is mined (invalidate()). A miss
+    loads all READS in one Multicall3 round trip when it is deployed;
+    concurrent misses share that load. snapshot() resolves the head once and
+    returns reads that were all made at that one block.
+    """
+
+    READS = ("portfolioAssetsList", "assetBalances", "getPortfolioValue", "totalShares")
+
+    def __init__(self, chain: ChainClient, multicall: Optional[Multicall] = None):
+        self.chain = chain
+        self.multicall = multicall
+        self.entries: Dict[str, Any] = {}     # read -> (block_number, value)
+        self.valuations = OrderedDict()       # (block_number, users) -> valuation, least recently used first
+        self.lock = threading.Lock()
+        self.min_block = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def head(self) -> int:
+        return max(self.chain.latest_block(), self.min_block)
+
+    def read_all(self, functions, block: int) -> List[CallResult]:
+        """Results of bound contract calls at `block`: one multicall, or one eth_call each without it"""
+        if self.multicall and self.multicall.is_available():
+            return self.multicall.call(functions, block)
+        results = []
+        for function in functions:
+            try:
+                results.append(CallResult(True, function.call(block_identifier=block)))
+            except Exception as e:
+                data = getattr(e, "data", None)
+                if self.multicall and isinstance(data, str) and data.startswith("0x"):
+                    self.multicall.register_errors(function.contract_abi)
+                    results.append(self.multicall.decode_error(bytes.fromhex(data[2:])))
+                else:
+                    results.append(CallResult(False, error=str(e)))
+        return results
+
+    def cached(self, names, block: int) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """(block, values) when every read in `names` is cached at one block no older than `block`"""
+        entries = [self.entries.get(name) for name in names]
+        if all(entries) and len({entry[0] for entry in entries}) == 1 and entries[0][0] >= block:
+            self.hits += 1
+            return entries[0][0], {name: entry[1] for name, entry in zip(names, entries)}
+        return None
+
+    def load(self, names, block: int) -> Tuple[int, Dict[str, Any]]:
+        """(block, values) of the READS in `names`, all read at one block no older than `block`"""
+        cached = self.cached(names, block)
+        if cached:
+            return cached
+        with self.lock:
+            cached = self.cached(names, block)
+            if cached:
+                return cached
+            self.misses += 1
+            functions = self.chain.contract().functions
+            loads = self.READS if self.multicall and self.multicall.is_available() else names
+            results = dict(zip(loads, self.read_all([getattr(functions, read)() for read in loads], block)))
+            for read, result in results.items():
+                if result.success:
+                    self.entries[read] = (block, result.value)
+                else:
+                    self.entries.pop(read, None)
+            for name in names:
+                if not results[name].success:
+                    result = results[name]
+                    raise Exception(f"{name}() reverted: {result.error} {result.error_args or ''}".strip())
+            return block, {name: results[name].value for name in names}
+
+    def get(self, name: str):
+        """Value of one READS view function at the current head block"""
+        return self.load((name,), self.head())[1][name]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """All READS at one block, no older than the current head block"""
+        block, values = self.load(self.READS, self.head())
+        values["block_number"] = block
+        return values
+
+    def valuation(self, users=()) -> Dict[str, Any]:
+        """Balances, oracle prices, portfolio value and per-user share values at one block.
+
+        Two round trips whatever the number of assets or users: the
+        portfolio reads plus getUserShareValue for every user, then
+        getPriceInfo/getPrice for every asset. A reverting price (e.g.
+        PriceExpired) is reported on that asset only.
+        """
+        users = tuple(Web3.to_checksum_address(user) for user in users)
+        key = (self.head(), users)
+        with self.lock:
+            valuation = self.valuations.get(key)
+            if valuation is not None:
+                self.valuations.move_to_end(key)
+                self.hits += 1
+                return valuation
+            self.misses += 1
+            valuation = self.load_valuation(*key)
+            self.valuations[key] = valuation
+            while len(self.valuations) > VALUATION_CACHE_SIZE:
+                self.valuations.popitem(last=False)
+            return valuation
+
+    def load_valuation(self, block: int, users) -> Dict[str, Any]:
+        """valuation() read from the chain; call with self.lock held"""
+        functions = self.chain.contract().functions
+        first = [getattr(functions, name)() for name in self.READS] + [functions.priceOracle()]
+        first += [functions.getUserShareValue(user) for user in users]
+        results = self.read_all(first, block)
+        reads = dict(zip(self.READS, results))
+        for name, result in reads.items():
+            if result.success:
+                self.entries[name] = (block, result.value)
+        oracle_result = results[len(self.READS)]
+        user_results = results[len(self.READS) + 1:]
+
+        assets, balances = reads["assetBalances"].value if reads["assetBalances"].success else ([], [])
+        price_results = []
+        if assets and oracle_result.success:
+            oracle = self.chain.contract(oracle_result.value, UNIPOOL_ORACLE_ABI).functions
+            price_calls = []
+            for asset in assets:
+                price_calls += [oracle.getPriceInfo(asset), oracle.getPrice(asset)]
+            price_results = self.read_all(price_calls, block)
+
+        def value(result):
+            return str(result.value) if result.success else None
+
+        asset_rows = []
+        for i, (asset, balance) in enumerate(zip(assets, balances)):
+            row = {"address": Web3.to_checksum_address(asset), "balance": str(balance)}
+            if price_results:
+                info, price = price_results[2 * i], price_results[2 * i + 1]
+                if info.success:
+                    row.update({"last_updated": info.value[1], "is_active": info.value[2], "is_expired": info.value[3]})
+                row["price"] = value(price)
+                if not price.success:
+                    row["price_error"] = price.to_dict()
+            asset_rows.append(row)
+
+        valuation = {
+            "block_number": block,
+            "assets": asset_rows,
+            "portfolio_value": value(reads["getPortfolioValue"]),
+            "total_shares": value(reads["totalShares"]),
+            "price_oracle": oracle_result.value if oracle_result.success else None,
+            "users": {user: (value(result) if result.success else result.to_dict())
+                      for user, result in zip(users, user_results)},
+        }
+        return valuation
+
+    def invalidate(self, block_number: Optional[int] = None) -> None:
+        """Drop cached reads, e.g. once one of our transactions is mined in `block_number`"""
+        if block_number is not None:
+            self.chain.observe_block(block_number)
+            self.min_block = max(self.min_block, block_number)
+        with self.lock:
+            self.entries = {}
+            self.valuations = OrderedDict()
+        self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "cached": {name: entry[0] for name, entry in self.entries.items()},
+            "valuations": len(self.valuations),
+            "multicall": self.multicall.stats() if self.multicall else None
+        }
@@ -0,0 +1,453 @@
+import os
+import json
+import time
+import sqlite3
+import atexit
+import logging
+import threading
+from typing import Dict, List, Optional, Any, Callable
+
+from web3 import Web3
+from web3.exceptions import Web3RPCError
+from eth_utils import event_abi_to_log_topic
+
+logger = logging.getLogger(__name__)
+
+EVENT_INDEX_PATH = os.getenv("EVENT_INDEX_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "event_index.db"))
+EVENT_INDEX_START_BLOCK = os.getenv("EVENT_INDEX_START_BLOCK")  # contract deployment block; unset = the head at the first poll
+EVENT_INDEX_CHUNK = int(os.getenv("EVENT_INDEX_CHUNK", 2000))  # blocks per eth_getLogs request
+EVENT_INDEX_INTERVAL = float(os.getenv("EVENT_INDEX_INTERVAL", 15))  # seconds between polls at the head
+EVENT_INDEX_REORG_DEPTH = int(os.getenv("EVENT_INDEX_REORG_DEPTH", 128))  # blocks searched for a common ancestor
+EVENT_INDEX_RANGE_ATTEMPTS = 3  # eth_getLogs retries while a reorg makes logs and headers disagree
+
+INDEXED_EVENTS = ("Rebalanced", "Invest", "Withdraw", "AssetSwapped")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blocks (
+    number INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL,
+    timestamp INTEGER
+);
+CREATE TABLE IF NOT EXISTS checkpoint (
+    name TEXT PRIMARY KEY,
+    block_number INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    block_number INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    tx_hash TEXT NOT NULL,
+    event TEXT NOT NULL,
+    args TEXT NOT NULL,
+    PRIMARY KEY (block_number, log_index)
+);
+CREATE INDEX IF NOT EXISTS events_event ON events (event, block_number);
+CREATE TABLE IF NOT EXISTS trades (
+    block_number INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    tx_hash TEXT NOT NULL,
+    from_token TEXT NOT NULL,
+    to_token TEXT NOT NULL,
+    amount_in TEXT NOT NULL,
+    amount_out TEXT NOT NULL,
+    PRIMARY KEY (block_number, log_index)
+);
+CREATE INDEX IF NOT EXISTS trades_from_token ON trades (from_token, block_number);
+CREATE INDEX IF NOT EXISTS trades_to_token ON trades (to_token, block_number);
+CREATE TABLE IF NOT EXISTS flows (
+    block_number INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    tx_hash TEXT NOT NULL,
+    user TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    amount TEXT NOT NULL,
+    sent_to_user TEXT,
+    sent_to_treasury TEXT,
+    PRIMARY KEY (block_number, log_index)
+);
+CREATE INDEX IF NOT EXISTS flows_user ON flows (user, block_number);
+CREATE TABLE IF NOT EXISTS rebalance_legs (
+    block_number INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    side TEXT NOT NULL,
+    token TEXT NOT NULL,
+    amount TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rebalance_legs_token ON rebalance_legs (token, block_number);
+CREATE INDEX IF NOT EXISTS rebalance_legs_block ON rebalance_legs (block_number, log_index);
+"""
+
+# Tables holding per-block data, rolled back together on a reorg
+BLOCK_TABLES = ("events", "trades", "flows", "rebalance_legs")
+
+
+class EventIndex():
+    """Incremental indexer of the Unipool events into SQLite.
+
+    A background thread pulls Rebalanced/Invest/Withdraw/AssetSwapped logs
+    from the checkpoint to the head in chunks of EVENT_INDEX_CHUNK blocks
+    (halved while the provider rejects a range), and commits each chunk's
+    rows together with the new checkpoint. The hash of every indexed block
+    with events and of every chunk end is kept: when the checkpoint block's
+    hash no longer matches the chain, rows past the newest block that still
+    matches are deleted and re-indexed. A range whose logs carry another
+    blockHash than the header fetched for their block raced a reorg and is
+    queried again.
+
+    Without a start block (EVENT_INDEX_START_BLOCK) the first poll starts
+    at the current head rather than scanning from genesis.
+
+    uint256 amounts are stored as decimal strings. Queries never touch the
+    chain. The SQLite file is opened by start() or the first query, not
+    when the index is created.
+    """
+
+    def __init__(self, chain, path: str = EVENT_INDEX_PATH, start_block=EVENT_INDEX_START_BLOCK,
+                 chunk: int = EVENT_INDEX_CHUNK, interval: float = EVENT_INDEX_INTERVAL,
+                 on_events: Optional[Callable[[List[Dict[str, Any]]], None]] = None):
+        self.chain = chain
+        self.path = path
+        self.start_block = int(start_block) if start_block not in (None, "") else None
+        self.max_chunk = chunk
+        self.chunk = chunk
+        self.interval = interval
+        self.on_events = on_events
+        self.lock = threading.Lock()
+        self.db = None
+        self.events_by_topic = None
+        self.thread = None
+        self.closed = False
+        self.polls = 0
+        self.requests = 0
+        self.indexed = 0
+        self.reorgs = 0
+        self.races = 0
+        self.errors = 0
+        self.last_error = None
+
+    def open(self) -> sqlite3.Connection:
+        """The SQLite connection, created with the schema on first use; call with self.lock held"""
+        if self.db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+            self.db = db
+        return self.db
+
+    # --- indexing ---
+
+    def event_topics(self) -> Dict[bytes, Any]:
+        """topic0 -> contract event, for the indexed events of the Unipool ABI"""
+        if self.events_by_topic is None:
+            contract = self.chain.contract()
+            self.events_by_topic = {
+                event_abi_to_log_topic(item): contract.events[item["name"]]()
+                for item in contract.abi if item.get("type") == "event" and item["name"] in INDEXED_EVENTS
+            }
+        return self.events_by_topic
+
+    def checkpoint(self) -> int:
+        """Last fully indexed block, start_block - 1 before the first poll"""
+        with self.lock:
+            row = self.open().execute("SELECT block_number FROM checkpoint WHERE name = 'last_block'").fetchone()
+        if row:
+            return row[0]
+        return self.start_block - 1 if self.start_block is not None else -1
+
+    def resolve_start_block(self, head: int) -> int:
+        """First indexed block without EVENT_INDEX_START_BLOCK: the head at the first poll, kept across restarts.
+
+        Scanning eth_getLogs from genesis would take a long time and hammer
+        the provider, so events before that block are not indexed.
+        """
+        with self.lock, self.open():
+            row = self.db.execute("SELECT block_number FROM checkpoint WHERE name = 'start_block'").fetchone()
+            if row:
+                return row[0]
+            self.db.execute("INSERT INTO checkpoint (name, block_number) VALUES ('start_block', ?)", (head,))
+        logger.warning(f"Event index: EVENT_INDEX_START_BLOCK is not set, indexing from the current head {head}; "
+                       f"set it to the contract deployment block to index the full history")
+        return head
+
+    def poll(self) -> int:
+        """Index everything up to the current head; returns the number of new events"""
+        self.polls += 1
+        head = self.chain.latest_block(max_age=0)
+        if self.start_block is None:
+            self.start_block = self.resolve_start_block(head)
+        self.handle_reorg()
+        found = 0
+        while not self.closed:
+            start = self.checkpoint() + 1
+            if start > head:
+                break
+            end = min(start + self.chunk - 1, head)
+            try:
+                found += self.index_range(start, end)
+            except Web3RPCError as e:
+                # Range or result limit of the provider: retry with smaller chunks
+                if self.chunk == 1:
+                    raise
+                self.chunk = max(1, self.chunk // 2)
+                logger.warning(f"Event index: eth_getLogs {start}-{end} rejected ({e}), chunk now {self.chunk}")
+                continue
+            self.chunk = min(self.max_chunk, self.chunk * 2)
+        return found
+
+    def fetch_range(self, start: int, end: int):
+        """(logs, headers) of a block range, every log belonging to the header fetched for its block"""
+        w3 = self.chain.w3
+        topics = self.event_topics()
+        for _ in range(EVENT_INDEX_RANGE_ATTEMPTS):
+            self.requests += 1
+            logs = [log for log in w3.eth.get_logs({
+                "address": Web3.to_checksum_address(self.chain.contract_address),
+                "fromBlock": start,
+                "toBlock": end,
+                "topics": [["0x" + topic.hex() for topic in topics]],
+            }) if not log.get("removed")]
+            headers = {}
+            for number in sorted({log["blockNumber"] for log in logs} | {end}):
+                block = w3.eth.get_block(number)
+                headers[number] = ("0x" + bytes(block["hash"]).hex(), block["timestamp"])
+            if all("0x" + bytes(log["blockHash"]).hex() == headers[log["blockNumber"]][0] for log in logs):
+                return logs, headers
+            self.races += 1
+            logger.warning(f"Event index: logs of {start}-{end} and their block headers differ (reorg), querying again")
+        raise Exception(f"Event index: blocks {start}-{end} kept changing over {EVENT_INDEX_RANGE_ATTEMPTS} attempts")
+
+    def index_range(self, start: int, end: int) -> int:
+        topics = self.event_topics()
+        logs, headers = self.fetch_range(start, end)
+
+        decoded = []
+        for log in logs:
+            event = topics.get(bytes(log["topics"][0]))
+            if event is None:
+                continue
+            args = self.normalize(dict(event.process_log(log)["args"]))
+            decoded.append({
+                "block_number": log["blockNumber"],
+                "log_index": log["logIndex"],
+                "tx_hash": "0x" + bytes(log["transactionHash"]).hex(),
+                "event": event.event_name,
+                "timestamp": headers[log["blockNumber"]][1],
+                "args": args,
+            })
+
+        with self.lock, self.open():
+            self.db.executemany("INSERT OR REPLACE INTO blocks (number, hash, timestamp) VALUES (?, ?, ?)",
+                                [(number, block_hash, timestamp) for number, (block_hash, timestamp) in headers.items()])
+            for event in decoded:
+                self.store(event)
+            self.db.execute("INSERT OR REPLACE INTO checkpoint (name, block_number) VALUES ('last_block', ?)", (end,))
+        self.indexed += len(decoded)
+        if decoded and self.on_events:
+            self.on_events(decoded)
+        return len(decoded)
+
+    @staticmethod
+    def normalize(value):
+        """Event args as JSON-safe values: uint256 as decimal strings, addresses checksummed"""
+        if isinstance(value, dict):
+            return {key: EventIndex.normalize(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [EventIndex.normalize(item) for item in value]
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, int):
+            return str(value)
+        if isinstance(value, (bytes, bytearray)):
+            return "0x" + bytes(value).hex()
+        return value
+
+    def store(self, event: Dict[str, Any]) -> None:
+        key = (event["block_number"], event["log_index"])
+        args = event["args"]
+        for table in BLOCK_TABLES:
+            self.db.execute(f"DELETE FROM {table} WHERE block_number = ? AND log_index = ?", key)
+        self.db.execute("INSERT INTO events (block_number, log_index, tx_hash, event, args) VALUES (?, ?, ?, ?, ?)",
+                        key + (event["tx_hash"], event["event"], json.dumps(args)))
+        name = event["event"]
+        if name == "AssetSwapped":
+            self.db.execute("INSERT INTO trades VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            key + (event["tx_hash"], args["fromToken"], args["toToken"], args["amountIn"], args["amountOut"]))
+        elif name == "Invest":
+            self.db.execute("INSERT INTO flows VALUES (?, ?, ?, ?, 'invest', ?, NULL, NULL)",
+                            key + (event["tx_hash"], args["investor"], args["amount"]))
+        elif name == "Withdraw":
+            self.db.execute("INSERT INTO flows VALUES (?, ?, ?, ?, 'withdraw', ?, ?, ?)",
+                            key + (event["tx_hash"], args["investor"], args["amount"], args["sentToUser"], args["sentToTreasury"]))
+        elif name == "Rebalanced":
+            legs = [key + ("sell", token, amount) for token, amount in zip(args["sellAssets"], args["sellAmounts"])]
+            legs += [key + ("buy", token, amount) for token, amount in zip(args["buyAssets"], args["buyAmounts"])]
+            self.db.executemany("INSERT INTO rebalance_legs VALUES (?, ?, ?, ?, ?)", legs)
+
+    def handle_reorg(self) -> Optional[int]:
+        """Roll back to the newest stored block still on the chain; returns that block if a reorg was found"""
+        last = self.checkpoint()
+        with self.lock:
+            stored = self.open().execute("SELECT number, hash FROM blocks WHERE number <= ? ORDER BY number DESC LIMIT ?",
+                                     (last, EVENT_INDEX_REORG_DEPTH)).fetchall()
+        if not stored or stored[0]["number"] != last or self.canonical(stored[0]):
+            return None
+
+        ancestor = None
+        for row in stored[1:]:
+            if self.canonical(row):
+                ancestor = row["number"]
+                break
+        if ancestor is None:
+            # Deeper than the blocks we can compare: re-index the whole window
+            ancestor = max(self.start_block - 1, stored[-1]["number"] - 1)
+        with self.lock, self.open():
+            for table in BLOCK_TABLES + ("blocks",):
+                column = "number" if table == "blocks" else "block_number"
+                self.db.execute(f"DELETE FROM {table} WHERE {column} > ?", (ancestor,))
+            self.db.execute("INSERT OR REPLACE INTO checkpoint (name, block_number) VALUES ('last_block', ?)", (ancestor,))
+        self.reorgs += 1
+        logger.warning(f"Event index: reorg below block {last}, rolled back to {ancestor}")
+        if self.on_events:
+            self.on_events([{"event": "Reorg", "block_number": ancestor}])
+        return ancestor
+
+    def canonical(self, row) -> bool:
+        block = self.chain.w3.eth.get_block(row["number"])
+        return "0x" + bytes(block["hash"]).hex() == row["hash"]
+
+    def start(self) -> None:
+        with self.lock:
+            self.open()
+        if self.thread is None and self.chain.configured:
+            self.thread = threading.Thread(target=self.run, name="event-index", daemon=True)
+            self.thread.start()
+            atexit.register(self.close)
+
+    def run(self) -> None:
+        while not self.closed:
+            try:
+                self.poll()
+                self.last_error = None
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+                logger.warning(f"Event index: poll failed: {e}")
+            time.sleep(self.interval)
+
+    def close(self) -> None:
+        self.closed = True
+
+    # --- queries ---
+
+    @staticmethod
+    def address(value: Optional[str]) -> Optional[str]:
+        return Web3.to_checksum_address(value) if value else None
+
+    def query(self, sql: str, params) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [dict(row) for row in self.open().execute(sql, params).fetchall()]
+
+    @staticmethod
+    def block_filter(from_block: Optional[int], to_block: Optional[int], column: str = "block_number"):
+        clauses, params = [], []
+        if from_block is not None:
+            clauses.append(f"{column} >= ?")
+            params.append(from_block)
+        if to_block is not None:
+            clauses.append(f"{column} <= ?")
+            params.append(to_block)
+        return clauses, params
+
+    def activity(self, event: Optional[str] = None, from_block: Optional[int] = None,
+                 to_block: Optional[int] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Indexed events of any kind, newest first"""
+        clauses, params = self.block_filter(from_block, to_block, "e.block_number")
+        if event:
+            clauses.append("e.event = ?")
+            params.append(event)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self.query(f"""SELECT e.*, b.timestamp FROM events e LEFT JOIN blocks b ON b.number = e.block_number
+                              {where} ORDER BY e.block_number DESC, e.log_index DESC LIMIT ?""", params + [limit])
+        for row in rows:
+            row["args"] = json.loads(row["args"])
+        return rows
+
+    def trades(self, token: Optional[str] = None, from_block: Optional[int] = None,
+               to_block: Optional[int] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """AssetSwapped history, newest first, optionally for swaps in or out of `token`"""
+        clauses, params = self.block_filter(from_block, to_block, "t.block_number")
+        sql = "SELECT t.*, b.timestamp FROM trades t LEFT JOIN blocks b ON b.number = t.block_number"
+        if token:
+            # UNION of two indexed lookups rather than an OR the planner would scan
+            token = self.address(token)
+            where = " AND ".join(clauses + ["t.{} = ?"])
+            sql = " UNION ".join(f"{sql} WHERE {where.format(column)}" for column in ("from_token", "to_token"))
+            params = params + [token] + params + [token]
+        elif clauses:
+            sql += f" WHERE {' AND '.join(clauses)}"
+        return self.query(f"SELECT * FROM ({sql}) ORDER BY block_number DESC, log_index DESC LIMIT ?", params + [limit])
+
+    def flows(self, user: Optional[str] = None, kind: Optional[str] = None, from_block: Optional[int] = None,
+              to_block: Optional[int] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Invest/Withdraw history, newest first"""
+        clauses, params = self.block_filter(from_block, to_block, "f.block_number")
+        if user:
+            clauses.append("f.user = ?")
+            params.append(self.address(user))
+        if kind:
+            clauses.append("f.kind = ?")
+            params.append(kind)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self.query(f"""SELECT f.*, b.timestamp FROM flows f LEFT JOIN blocks b ON b.number = f.block_number
+                              {where} ORDER BY f.block_number DESC, f.log_index DESC LIMIT ?""", params + [limit])
+
+    def flow_totals(self, user: Optional[str] = None, kind: Optional[str] = None, from_block: Optional[int] = None,
+                    to_block: Optional[int] = None) -> Dict[str, Dict[str, str]]:
+        """Invested, withdrawn and net amounts per user over the same filters as flows()
+        (summed exactly, outside SQLite's int64)"""
+        clauses, params = self.block_filter(from_block, to_block)
+        if user:
+            clauses.append("user = ?")
+            params.append(self.address(user))
+        if kind:
+            clauses.append("kind = ?")
+            params.append(kind)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        totals = {}
+        for row in self.query(f"SELECT user, kind, amount FROM flows {where}", params):
+            entry = totals.setdefault(row["user"], {"invested": 0, "withdrawn": 0})
+            entry["invested" if row["kind"] == "invest" else "withdrawn"] += int(row["amount"])
+        return {user: {"invested": str(entry["invested"]), "withdrawn": str(entry["withdrawn"]),
+                       "net": str(entry["invested"] - entry["withdrawn"])} for user, entry in totals.items()}
+
+    def rebalances(self, token: Optional[str] = None, from_block: Optional[int] = None,
+                   to_block: Optional[int] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Rebalanced events, newest first, optionally only those selling or buying `token`"""
+        clauses, params = self.block_filter(from_block, to_block, "e.block_number")
+        clauses.append("e.event = 'Rebalanced'")
+        if token:
+            clauses.append("""EXISTS (SELECT 1 FROM rebalance_legs l WHERE l.token = ?
+                              AND l.block_number = e.block_number AND l.log_index = e.log_index)""")
+            params.append(self.address(token))
+        rows = self.query(f"""SELECT e.block_number, e.log_index, e.tx_hash, e.args, b.timestamp FROM events e
+                              LEFT JOIN blocks b ON b.number = e.block_number WHERE {' AND '.join(clauses)}
+                              ORDER BY e.block_number DESC, e.log_index DESC LIMIT ?""", params + [limit])
+        for row in rows:
+            row.update(json.loads(row.pop("args")))
+        return rows
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            counts = {table: self.open().execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in BLOCK_TABLES}
+        return {
+            "checkpoint": self.checkpoint(),
+            "chunk": self.chunk,
+            "polls": self.polls,
+            "get_logs_requests": self.requests,
+            "indexed": self.indexed,
+            "reorgs": self.reorgs,
+            "reorg_races": self.races,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "rows": counts
+        }
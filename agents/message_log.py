@@ -0,0 +1,376 @@
+import os
+import re
+import json
+import time
+import zlib
+import struct
+import atexit
+import logging
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_LOG_PATH = os.getenv("MESSAGE_LOG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "message_log"))
+MESSAGE_QUEUE_SIZE = 200  # messages kept in memory (and after compaction) per topic
+MESSAGE_LOG_FSYNC_INTERVAL = float(os.getenv("MESSAGE_LOG_FSYNC_INTERVAL", 0.05))  # seconds between group commits
+MESSAGE_LOG_COMPACT_FACTOR = 4  # compact once the active segment holds this many times maxlen records
+
+# Record framing: payload length, CRC32 of the payload, then the JSON payload
+RECORD_HEADER = struct.Struct("<II")
+TOPIC_NAME_FILE = "topic"  # original topic name, next to the segments
+
+
+class TopicLog():
+    """Append-only segment files for one topic.
+
+    Segments are named after the offset of their first record. Appends are
+    O(message); once the active segment holds MESSAGE_LOG_COMPACT_FACTOR *
+    maxlen records the last `maxlen` messages are rewritten into a new segment and
+    older segments are deleted. Offsets are never reused, so a crash in the
+    middle of compaction only leaves records that recovery skips.
+    """
+
+    def __init__(self, directory: str, maxlen: int = MESSAGE_QUEUE_SIZE):
+        self.directory = directory
+        self.maxlen = maxlen
+        self.tail = deque(maxlen=maxlen)  # (offset, message) kept for compaction
+        self.next_offset = 0
+        self.segment_start = 0
+        self.segment_records = 0
+        self.file = None
+        self.dirty = False
+        self.compactions = 0
+        self.truncated = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def segment_path(self, start: int) -> str:
+        return os.path.join(self.directory, f"{start:020d}.log")
+
+    def segments(self) -> List[int]:
+        return sorted(int(name[:-4]) for name in os.listdir(self.directory) if name.endswith(".log"))
+
+    @staticmethod
+    def encode(message: Any) -> bytes:
+        payload = json.dumps(message, default=str, separators=(",", ":")).encode("utf-8")
+        return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+    def read_segment(self, path: str) -> Tuple[List[Any], int]:
+        """Decoded records of a segment and the byte length of its valid prefix"""
+        with open(path, "rb") as f:
+            data = f.read()
+        records, position = [], 0
+        while position + RECORD_HEADER.size <= len(data):
+            length, crc = RECORD_HEADER.unpack_from(data, position)
+            start = position + RECORD_HEADER.size
+            payload = data[start:start + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            try:
+                records.append(json.loads(payload))
+            except ValueError:
+                break
+            position = start + length
+        return records, position
+
+    def recover(self) -> List[Any]:
+        """Replay the segments, cut a torn tail and reopen the last segment for appends"""
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp"):
+                os.remove(os.path.join(self.directory, name))
+        starts = self.segments()
+        for i, start in enumerate(starts):
+            path = self.segment_path(start)
+            records, valid = self.read_segment(path)
+            if valid < os.path.getsize(path):
+                if i == len(starts) - 1:
+                    with open(path, "r+b") as f:
+                        f.truncate(valid)
+                    self.truncated += 1
+                    logger.warning(f"Message log {path}: truncated torn tail at byte {valid}")
+                else:
+                    logger.warning(f"Message log {path}: corrupt record at byte {valid}, later records skipped")
+            for j, message in enumerate(records):
+                offset = start + j
+                if offset >= self.next_offset:
+                    self.tail.append((offset, message))
+                    self.next_offset = offset + 1
+            self.segment_start, self.segment_records = start, len(records)
+        # Segments fully superseded by a later one are left over from an interrupted compaction
+        for start in starts[:-1]:
+            os.remove(self.segment_path(start))
+        if not starts:
+            self.segment_start = self.segment_records = 0
+        self.file = open(self.segment_path(self.segment_start), "ab")
+        return self.messages()
+
+    def messages(self) -> List[Any]:
+        return [message for _, message in self.tail]
+
+    def read(self, after: int, limit: Optional[int] = None) -> List[Tuple[int, Any]]:
+        """(seq, message) pairs newer than `after`, walking back from the newest"""
+        newer = []
+        for seq, message in reversed(self.tail):
+            if seq <= after:
+                break
+            newer.append((seq, message))
+        newer.reverse()
+        return newer[:limit] if limit else newer
+
+    def append(self, message: Any) -> int:
+        offset = self.next_offset
+        self.file.write(self.encode(message))
+        self.tail.append((offset, message))
+        self.next_offset += 1
+        self.segment_records += 1
+        self.dirty = True
+        if self.segment_records >= MESSAGE_LOG_COMPACT_FACTOR * self.maxlen:
+            self.compact()
+        return offset
+
+    def compact(self) -> None:
+        """Rewrite the retained tail into a fresh segment and drop the old ones"""
+        start = self.tail[0][0] if self.tail else self.next_offset
+        old_starts = self.segments()
+        tmp_path = self.segment_path(start) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(b"".join(self.encode(message) for _, message in self.tail))
+            f.flush()
+            os.fsync(f.fileno())
+        self.file.close()
+        os.replace(tmp_path, self.segment_path(start))
+        self.sync_directory()
+        for old in old_starts:
+            if old != start:
+                os.remove(self.segment_path(old))
+        self.segment_start, self.segment_records = start, len(self.tail)
+        self.file = open(self.segment_path(start), "ab")
+        self.dirty = False
+        self.compactions += 1
+
+    def sync_directory(self) -> None:
+        if hasattr(os, "O_DIRECTORY"):
+            fd = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def sync(self) -> None:
+        if self.dirty:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.dirty = False
+
+    def detach_for_sync(self) -> Optional[int]:
+        """Flush buffered writes and return a dup'd fd to fsync without holding the log lock"""
+        if not self.dirty:
+            return None
+        self.file.flush()
+        self.dirty = False
+        return os.dup(self.file.fileno())
+
+    def close(self) -> None:
+        if self.file:
+            self.sync()
+            self.file.close()
+            self.file = None
+
+
+class MessageLog():
+    """Durable MCP message bus storage: one TopicLog per topic with group commit.
+
+    append() only writes to the OS buffer; a background thread flushes and
+    fsyncs every topic with pending writes each MESSAGE_LOG_FSYNC_INTERVAL
+    seconds, so a burst of publishes costs one fsync per topic.
+
+    Every message gets its topic's next sequence number (its log offset).
+    Consumers read with a cursor, keep durable per-consumer offsets in
+    cursors.json and can block in wait() until something newer arrives.
+    """
+
+    def __init__(self, path: str = MESSAGE_LOG_PATH, maxlen: int = MESSAGE_QUEUE_SIZE,
+                 fsync_interval: float = MESSAGE_LOG_FSYNC_INTERVAL):
+        self.path = path
+        self.maxlen = maxlen
+        self.fsync_interval = fsync_interval
+        self.topics: Dict[str, TopicLog] = {}
+        self.lock = threading.Lock()
+        self.published = threading.Condition(self.lock)  # notified on every append
+        self.cursors_lock = threading.Lock()  # serializes cursors.json writes, taken before self.lock
+        self.cursors_version = 0  # bumped on every cursor change
+        self.cursors_written = 0  # version last written to cursors.json
+        self.appends = 0
+        self.group_commits = 0
+        self.flusher = None
+        self.closed = False
+        os.makedirs(path, exist_ok=True)
+        self.cursors_path = os.path.join(path, "cursors.json")
+        self.cursors: Dict[str, Dict[str, int]] = self.load_cursors()
+
+    @staticmethod
+    def directory_name(topic: str) -> str:
+        """Topic directory: the name itself when it is filesystem safe, else a sanitized name plus its CRC32"""
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", topic)
+        return name if name == topic else f"{name}-{zlib.crc32(topic.encode('utf-8')):08x}"
+
+    @staticmethod
+    def write_topic_name(directory: str, topic: str) -> None:
+        """Record the original topic name, which recover() cannot rebuild from a sanitized directory name"""
+        path = os.path.join(directory, TOPIC_NAME_FILE)
+        if os.path.exists(path):
+            return
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(topic)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def read_topic_name(directory: str) -> Optional[str]:
+        try:
+            with open(os.path.join(directory, TOPIC_NAME_FILE), encoding="utf-8") as f:
+                return f.read() or None
+        except FileNotFoundError:
+            return None
+
+    def topic_log(self, topic: str) -> TopicLog:
+        log = self.topics.get(topic)
+        if log is None:
+            directory = os.path.join(self.path, self.directory_name(topic))
+            log = self.topics[topic] = TopicLog(directory, self.maxlen)
+            self.write_topic_name(directory, topic)
+            log.recover()
+        return log
+
+    def recover(self) -> Dict[str, List[Any]]:
+        """Rebuild every topic's retained messages from disk"""
+        recovered = {}
+        with self.lock:
+            for name in sorted(os.listdir(self.path)):
+                directory = os.path.join(self.path, name)
+                if not os.path.isdir(directory):
+                    continue
+                # Logs written before the name file existed only used safe topic names
+                topic = self.read_topic_name(directory) or name
+                log = self.topics[topic] = TopicLog(directory, self.maxlen)
+                recovered[topic] = log.recover()
+        self.start()
+        return recovered
+
+    def retained(self) -> Dict[str, List[Any]]:
+        with self.lock:
+            return {topic: log.messages() for topic, log in self.topics.items()}
+
+    def append(self, topic: str, message: Any) -> int:
+        """Persist a message and return its sequence number"""
+        with self.lock:
+            offset = self.topic_log(topic).append(message)
+            self.appends += 1
+            self.published.notify_all()
+        return offset
+
+    def last_seq(self, topic: str) -> int:
+        """Sequence of the newest message of a topic, -1 when there is none"""
+        with self.lock:
+            log = self.topics.get(topic)
+            return log.next_offset - 1 if log else -1
+
+    def read(self, topic: str, after: int = -1, limit: Optional[int] = None) -> List[Tuple[int, Any]]:
+        """Retained (seq, message) pairs of a topic published after sequence `after`"""
+        with self.lock:
+            log = self.topics.get(topic)
+            return log.read(after, limit) if log else []
+
+    def wait(self, topics: List[str], after: Dict[str, int], timeout: Optional[float] = None) -> bool:
+        """Block until one of `topics` has a message newer than its cursor in `after`; False on timeout"""
+        def newer():
+            return any(topic in self.topics and self.topics[topic].next_offset - 1 > after.get(topic, -1)
+                       for topic in topics)
+        with self.published:
+            return self.published.wait_for(newer, timeout)
+
+    def load_cursors(self) -> Dict[str, Dict[str, int]]:
+        try:
+            with open(self.cursors_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            logger.warning(f"Message log cursors unreadable, starting fresh: {e}")
+            return {}
+
+    def cursor(self, consumer: str, topic: str) -> Optional[int]:
+        """Last sequence `consumer` acknowledged on `topic`, None if it never did"""
+        with self.lock:
+            return self.cursors.get(consumer, {}).get(topic)
+
+    def commit(self, consumer: str, topic: str, seq: int) -> None:
+        """Durably record that `consumer` has processed `topic` up to `seq`.
+
+        The file write and fsync happen outside self.lock so publishers and
+        readers are not blocked; a commit that finds a newer snapshot already
+        written returns without writing again.
+        """
+        with self.lock:
+            offsets = self.cursors.setdefault(consumer, {})
+            if topic in offsets and offsets[topic] >= seq:
+                return
+            offsets[topic] = seq
+            self.cursors_version += 1
+            version = self.cursors_version
+        with self.cursors_lock:
+            with self.lock:
+                if self.cursors_written >= version:
+                    return
+                snapshot = json.dumps(self.cursors)
+                version = self.cursors_version
+            tmp_path = self.cursors_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(snapshot)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.cursors_path)
+            self.cursors_written = version
+
+    def start(self) -> None:
+        if self.flusher is None and self.fsync_interval > 0:
+            self.flusher = threading.Thread(target=self.run_flusher, name="message-log-fsync", daemon=True)
+            self.flusher.start()
+            atexit.register(self.close)
+
+    def run_flusher(self) -> None:
+        while not self.closed:
+            time.sleep(self.fsync_interval)
+            self.sync()
+
+    def sync(self) -> None:
+        """Group commit: flush and fsync every topic written since the last sync"""
+        with self.lock:
+            fds = [fd for fd in (log.detach_for_sync() for log in self.topics.values()) if fd is not None]
+            if fds:
+                self.group_commits += 1
+        # fsync outside the lock so publishers keep appending meanwhile
+        for fd in fds:
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def close(self) -> None:
+        self.closed = True
+        with self.lock:
+            for log in self.topics.values():
+                log.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "topics": {topic: log.next_offset for topic, log in self.topics.items()},
+                "appends": self.appends,
+                "group_commits": self.group_commits,
+                "compactions": sum(log.compactions for log in self.topics.values()),
+                "truncated_tails": sum(log.truncated for log in self.topics.values()),
+                "cursors": {consumer: dict(offsets) for consumer, offsets in self.cursors.items()}
+            }
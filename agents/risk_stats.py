@@ -0,0 +1,415 @@
+"""Streaming and batch risk statistics used by RiskAgent, the backtester and the benchmarks.
+
+Pure computation: importing this module opens no files and starts no threads.
+"""
+import bisect
+import heapq
+import math
+import threading
+from collections import defaultdict, deque
+
+import numpy as np
+
+
+class P2Quantile:
+    """Streaming quantile estimate in O(1) memory (Jain & Chlamtac P-square)"""
+    def __init__(self, p):
+        self.p = p
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x):
+        h, n = self.heights, self.positions
+        if len(h) < 5:
+            bisect.insort(h, x)
+            return
+        if x < h[0]:
+            h[0] = x
+            k = 0
+        elif x >= h[4]:
+            h[4] = x
+            k = 3
+        else:
+            k = bisect.bisect_right(h, x) - 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+        for i in (1, 2, 3):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                parabolic = h[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (h[i + 1] - h[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (h[i] - h[i - 1]) / (n[i] - n[i - 1]))
+                if h[i - 1] < parabolic < h[i + 1]:
+                    h[i] = parabolic
+                else:
+                    h[i] = h[i] + d * (h[i + d] - h[i]) / (n[i + d] - n[i])
+                n[i] += d
+
+    def value(self):
+        if not self.heights:
+            return 0.0
+        if len(self.heights) < 5 or self.positions[4] < 5:
+            return self.heights[int(self.p * len(self.heights))]
+        return self.heights[2]
+
+
+class WindowQuantile:
+    """Order statistic of a sliding window in O(log W) per add/remove.
+
+    `low` is a max-heap holding the k+1 smallest values (its top is the
+    answer) and `high` a min-heap with the rest. Removed values are deleted
+    lazily, per heap, when they reach its top; a heap is rebuilt once its
+    stale entries outnumber the live ones, which keeps memory O(W).
+    """
+    SIGNS = {"low": -1, "high": 1}
+
+    def __init__(self, q):
+        self.q = q
+        self.heaps = {"low": [], "high": []}  # low stores negated values
+        self.sizes = {"low": 0, "high": 0}
+        self.delayed = {"low": defaultdict(int), "high": defaultdict(int)}
+
+    def _top(self, side):
+        """Live top value of a heap, dropping deleted entries on the way"""
+        heap, delayed, sign = self.heaps[side], self.delayed[side], self.SIGNS[side]
+        while heap and delayed.get(sign * heap[0]):
+            value = sign * heapq.heappop(heap)
+            delayed[value] -= 1
+            if not delayed[value]:
+                del delayed[value]
+        return sign * heap[0] if heap else None
+
+    def _move(self, source, target):
+        self._top(source)
+        value = self.SIGNS[source] * heapq.heappop(self.heaps[source])
+        heapq.heappush(self.heaps[target], self.SIGNS[target] * value)
+        self.sizes[source] -= 1
+        self.sizes[target] += 1
+
+    def _balance(self):
+        count = self.sizes["low"] + self.sizes["high"]
+        target = int(self.q * count) + 1 if count else 0
+        while self.sizes["low"] > target:
+            self._move("low", "high")
+        while self.sizes["low"] < target:
+            self._move("high", "low")
+        for side in self.heaps:
+            self._top(side)
+            if len(self.heaps[side]) > 2 * self.sizes[side] + 16:
+                self._rebuild(side)
+
+    def _rebuild(self, side):
+        heap, delayed, sign = self.heaps[side], self.delayed[side], self.SIGNS[side]
+        live = []
+        for item in heap:
+            value = sign * item
+            if delayed.get(value):
+                delayed[value] -= 1
+                if not delayed[value]:
+                    del delayed[value]
+            else:
+                live.append(item)
+        heapq.heapify(live)
+        self.heaps[side] = live
+
+    def _side(self, x):
+        # Every value in `high` is >= the top of `low`
+        top = self._top("low")
+        return "low" if top is not None and x <= top else "high"
+
+    def add(self, x):
+        side = self._side(x)
+        heapq.heappush(self.heaps[side], self.SIGNS[side] * x)
+        self.sizes[side] += 1
+        self._balance()
+
+    def remove(self, x):
+        side = self._side(x)
+        self.delayed[side][x] += 1
+        self.sizes[side] -= 1
+        self._balance()
+
+    def value(self):
+        top = self._top("low")
+        return top if top is not None else 0.0
+
+
+class WindowDrawdown:
+    """Maximum drawdown of a sliding window of returns, O(1) amortized per return.
+
+    The window's cumulative log levels live in a two-stack queue where every
+    stack entry also carries the (max level, min level, largest drop) of the
+    entries below it. Popping the oldest level and reading the window's
+    drawdown are then amortized O(1), without re-scanning the window.
+    """
+    def __init__(self, window):
+        self.window = window
+        self.level = 0.0
+        self.front = []  # oldest level on top: (level, max, min, drop) of it and everything newer in this stack
+        self.back = [(0.0, 0.0, 0.0, 0.0)]  # newest level on top: aggregates of it and everything older
+
+    @staticmethod
+    def _push_back(stack, level):
+        if stack:
+            _, high, low, drop = stack[-1]
+            stack.append((level, max(high, level), min(low, level), max(drop, high - level)))
+        else:
+            stack.append((level, level, level, 0.0))
+
+    def add(self, ret):
+        self.level += math.log(max(1.0 + ret, 1e-300))
+        self._push_back(self.back, self.level)
+        # The window holds `window` returns, i.e. window + 1 levels including its base
+        if len(self.front) + len(self.back) > self.window + 1:
+            if not self.front:
+                while self.back:
+                    level = self.back.pop()[0]
+                    if self.front:
+                        _, high, low, drop = self.front[-1]
+                        self.front.append((level, max(high, level), min(low, level), max(drop, level - low)))
+                    else:
+                        self.front.append((level, level, level, 0.0))
+            self.front.pop()
+
+    def value(self):
+        drop = 0.0
+        if self.front:
+            drop = self.front[-1][3]
+        if self.back:
+            drop = max(drop, self.back[-1][3])
+        if self.front and self.back:
+            drop = max(drop, self.front[-1][1] - self.back[-1][2])
+        return 1.0 - math.exp(-drop)
+
+
+class RiskAccumulator:
+    """Incremental VaR / Sharpe / volatility / drawdown over a stream of returns.
+
+    Unbounded (window=None), each update is O(1): Welford mean/variance, a
+    P-square quantile estimate for VaR and a running peak for drawdown. With a
+    `window` (RISK_WINDOW) the oldest return is removed as a new one arrives:
+    VaR is the exact window quantile from a WindowQuantile (O(log W)) and
+    drawdown comes from a WindowDrawdown (amortized O(1)); reads are O(1).
+    """
+    def __init__(self, window=None, confidence=0.95):
+        self.window = window or None
+        self.confidence = confidence
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.returns = deque(maxlen=self.window) if self.window else None
+        self.quantile = WindowQuantile(1 - self.confidence) if self.window else P2Quantile(1 - self.confidence)
+        self.window_drawdown = WindowDrawdown(self.window) if self.window else None
+        self.cumulative = 1.0
+        self.peak = 1.0
+        self.drawdown = 0.0
+        self.removals = 0
+
+    def update(self, ret):
+        with self.lock:
+            self._add(float(ret))
+
+    def extend(self, returns):
+        with self.lock:
+            for ret in returns:
+                self._add(float(ret))
+
+    def _add(self, x):
+        if self.window:
+            if len(self.returns) == self.window:
+                self._remove(self.returns[0])
+            self.returns.append(x)
+            self.quantile.add(x)
+            self.window_drawdown.add(x)
+        else:
+            self.quantile.add(x)
+            self.cumulative *= (1 + x)
+            if self.cumulative > self.peak:
+                self.peak = self.cumulative
+            self.drawdown = max(self.drawdown, (self.peak - self.cumulative) / self.peak)
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+
+    def _remove(self, x):
+        self.quantile.remove(x)
+        self.count -= 1
+        if self.count == 0:
+            self.mean = self.m2 = 0.0
+            return
+        delta = x - self.mean
+        self.mean -= delta / self.count
+        self.m2 = max(self.m2 - delta * (x - self.mean), 0.0)
+        self.removals += 1
+        if self.removals >= self.window:
+            # Re-anchor mean/m2 once per window to stop floating point drift
+            self.removals = 0
+            values = np.fromiter(self.returns, dtype=np.float64, count=len(self.returns))[1:]
+            self.mean = float(values.mean())
+            self.m2 = float(((values - self.mean) ** 2).sum())
+
+    @property
+    def volatility(self):
+        if self.count < 2:
+            return 0.0
+        return (self.m2 / (self.count - 1)) ** 0.5
+
+    @property
+    def sharpe_ratio(self):
+        std_dev = self.volatility
+        return self.mean / std_dev if std_dev > 0 else 0.0
+
+    @property
+    def var(self):
+        if not self.count:
+            return 0.0
+        return abs(self.quantile.value())
+
+    @property
+    def max_drawdown(self):
+        if not self.window:
+            return self.drawdown
+        return self.window_drawdown.value()
+
+    def metrics(self):
+        with self.lock:
+            return {
+                "var_95": self.var,
+                "sharpe_ratio": self.sharpe_ratio,
+                "volatility": self.volatility,
+                "max_drawdown": self.max_drawdown,
+                "count": self.count
+            }
+
+
+def calculate_var(returns: list[float], confidence: float) -> float:
+    if not returns:
+        return 0.0
+    sorted_returns = sorted(returns)
+    index = int((1 - confidence) * len(sorted_returns))
+    return abs(sorted_returns[index]) if index < len(sorted_returns) else 0.0
+
+
+def calculate_sharpe_ratio(returns: list[float]) -> float:
+    if not returns or len(returns) < 2:
+        return 0.0
+    avg_return = sum(returns) / len(returns)
+    variance = sum((r - avg_return) ** 2 for r in returns) / (len(returns) - 1)
+    std_dev = variance ** 0.5
+    return avg_return / std_dev if std_dev > 0 else 0.0
+
+
+def calculate_volatility(returns: list[float]) -> float:
+    if not returns or len(returns) < 2:
+        return 0.0
+    avg_return = sum(returns) / len(returns)
+    variance = sum((r - avg_return) ** 2 for r in returns) / (len(returns) - 1)
+    return variance ** 0.5
+
+
+def calculate_max_drawdown(returns: list[float]) -> float:
+    if not returns:
+        return 0.0
+    cumulative = 1.0
+    peak = 1.0
+    max_dd = 0.0
+    for ret in returns:
+        cumulative *= (1 + ret)
+        if cumulative > peak:
+            peak = cumulative
+        drawdown = (peak - cumulative) / peak
+        max_dd = max(max_dd, drawdown)
+    return max_dd
+
+
+def calculate_correlation_matrix(prices: dict[str, list[float]], window=None, halflife=None, min_periods=2) -> dict[str, dict[str, float]]:
+    """Correlation of returns between every pair of tokens.
+
+    Series of different lengths are aligned on their most recent value and
+    missing prices (None/NaN) are skipped pair by pair. `window` keeps only
+    the last N returns (rolling); `halflife` weights returns exponentially.
+    """
+    if not prices:
+        return {}
+    tokens = list(prices.keys())
+    corr = correlation_matrix_array(align_price_matrix(prices), window, halflife, min_periods)
+    rows = corr.tolist()
+    return {token1: dict(zip(tokens, row)) for token1, row in zip(tokens, rows)}
+
+
+def align_price_matrix(prices: dict[str, list[float]]) -> np.ndarray:
+    """(T x N) float matrix of prices, right-aligned, NaN where missing"""
+    length = max((len(series) for series in prices.values()), default=0)
+    matrix = np.full((length, len(prices)), np.nan)
+    for j, series in enumerate(prices.values()):
+        if len(series):
+            matrix[length - len(series):, j] = np.array(series, dtype=np.float64)
+    return matrix
+
+
+def correlation_matrix_array(price_matrix: np.ndarray, window=None, halflife=None, min_periods=2) -> np.ndarray:
+    """Pairwise-complete (optionally exponentially weighted) correlation of returns.
+
+    Returns are computed once for all tokens and every pair is reduced with
+    a handful of matrix products; pairs with fewer than `min_periods` common
+    returns or zero variance get 0.0, the diagonal is 1.0.
+    """
+    n_tokens = price_matrix.shape[1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = np.diff(price_matrix, axis=0) / price_matrix[:-1]
+    if window is not None:
+        returns = returns[-window:]
+    valid = np.isfinite(returns)
+    mask = valid.astype(np.float64)
+    x = np.where(valid, returns, 0.0)
+
+    if halflife is not None:
+        decay = 0.5 ** (1.0 / halflife)
+        weights = decay ** np.arange(len(x) - 1, -1, -1, dtype=np.float64)
+    else:
+        weights = np.ones(len(x))
+    wx = x * weights[:, None]
+    wmask = mask * weights[:, None]
+
+    count = mask.T @ mask
+    weight_sum = wmask.T @ mask
+    sum_x = wx.T @ mask              # [i, j] = sum of x_i where i and j are both present
+    sum_xx = (wx * x).T @ mask
+    sum_xy = wx.T @ x
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = sum_xy - sum_x * sum_x.T / weight_sum
+        var_i = sum_xx - sum_x ** 2 / weight_sum
+        var_j = var_i.T
+        corr = cov / np.sqrt(var_i * var_j)
+    corr = np.where((count >= min_periods) & (var_i > 0) & (var_j > 0) & np.isfinite(corr), corr, 0.0)
+    corr = np.clip(corr, -1.0, 1.0)
+    np.fill_diagonal(corr, 1.0)
+    return corr if n_tokens else np.zeros((0, 0))
+
+
+def calculate_correlation(prices1: list[float], prices2: list[float]) -> float:
+    if len(prices1) != len(prices2) or len(prices1) < 2:
+        return 0.0
+    returns1 = [(prices1[i] - prices1[i-1]) / prices1[i-1] for i in range(1, len(prices1))]
+    returns2 = [(prices2[i] - prices2[i-1]) / prices2[i-1] for i in range(1, len(prices2))]
+    if not returns1 or not returns2:
+        return 0.0
+    n = len(returns1)
+    mean1 = sum(returns1) / n
+    mean2 = sum(returns2) / n
+    numerator = sum((returns1[i] - mean1) * (returns2[i] - mean2) for i in range(n))
+    denominator1 = sum((returns1[i] - mean1) ** 2 for i in range(n)) ** 0.5
+    denominator2 = sum((returns2[i] - mean2) ** 2 for i in range(n)) ** 0.5
+    if denominator1 == 0 or denominator2 == 0:
+        return 0.0
+    return numerator / (denominator1 * denominator2)
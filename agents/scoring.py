@@ -0,0 +1,127 @@
+"""Research and risk scoring shared by the agents, the backtester and the benchmarks.
+
+Every score is computed over NumPy arrays of any shape: one token, a token
+universe, or a (time x tokens) backtest. Pure computation: importing this
+module opens no files and starts no threads.
+"""
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BUY_SCORE = 60   # comprehensive scores above are a BUY
+SELL_SCORE = 25  # comprehensive scores below are a SELL
+
+# Inputs of the comprehensive score -> (source, key, default when missing)
+SCORE_FIELDS = {
+    "price_change_24h": ("market", "price_change_24h", 0.0),
+    "volume_change_24h": ("market", "volume_change_24h", 0.0),
+    "market_cap": ("market", "market_cap", 0.0),
+    "volume_24h": ("market", "volume_24h", 0.0),
+    "news_sentiment": ("news", "sentiment_score", 50.0),
+    "social_sentiment": ("social", "sentiment_score", 50.0),
+}
+
+# % price changes scored by the performance risk, and their weights
+RISK_HORIZONS = ("price_change_1h", "price_change_24h", "price_change_7d", "price_change_14d")
+RISK_WEIGHTS = (0.6, 0.3, 0.05, 0.05)
+
+
+def score_fields(market_data, news_data=None, social_data=None):
+    """One token's scoring inputs as comprehensive_score_matrix fields (missing or null -> default)"""
+    sources = {"market": market_data, "news": news_data or {}, "social": social_data or {}}
+    fields = {}
+    for field, (source, key, default) in SCORE_FIELDS.items():
+        value = sources[source].get(key)
+        fields[field] = default if value is None else value
+    return fields
+
+
+def technical_score_matrix(price_change, volume_change):
+    price_change = np.asarray(price_change, dtype=np.float64)
+    volume_change = np.asarray(volume_change, dtype=np.float64)
+    technical = 50 + np.clip(price_change * 2, -30, 30)
+    technical = technical + np.where((volume_change > 0) & (price_change > 0), np.minimum(volume_change, 20), 0)
+    return np.clip(technical, 0, 100)
+
+
+def market_score_matrix(market_cap, volume_24h):
+    market_cap = np.asarray(market_cap, dtype=np.float64)
+    volume_24h = np.asarray(volume_24h, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        liquidity_ratio = np.where(market_cap > 0, volume_24h / market_cap, 0)
+    return np.minimum(liquidity_ratio * 1000, 50)
+
+
+def comprehensive_score_matrix(fields):
+    """Comprehensive score over arrays of any shape (one token, or e.g. time x tokens).
+
+    `fields` maps the SCORE_FIELDS names to arrays; missing keys take their
+    defaults. Returns (score, recommendation) where recommendation is
+    1 = BUY, 0 = HOLD, -1 = SELL.
+    """
+    def field(name):
+        return np.asarray(fields.get(name, SCORE_FIELDS[name][2]), dtype=np.float64)
+
+    technical = technical_score_matrix(field("price_change_24h"), field("volume_change_24h"))
+    market = market_score_matrix(field("market_cap"), field("volume_24h"))
+    score = np.clip(
+        technical * 0.6 +
+        field("news_sentiment") * 0.2 +
+        field("social_sentiment") * 0.19 +
+        market * 0.01, 0, 100)
+    recommendation = np.where(score > BUY_SCORE, 1, np.where(score < SELL_SCORE, -1, 0))
+    return score, recommendation
+
+
+def performance_risk_matrix(changes, weights=RISK_WEIGHTS):
+    """Vectorized risk for an (N tokens x horizons) matrix of % price changes.
+
+    Returns (std_risk, RiskScore) arrays: the weighted std of the
+    penalized changes, and that std min/max normalized across tokens.
+    Leading axes (e.g. time x tokens x horizons) are scored independently.
+    """
+    weights_arr = np.array(weights)
+    factors = np.where(
+        changes < 0,
+        1 + np.abs(changes)*2 / 100,
+        1 / (1 + changes*2 / 100)
+    )
+    penalized_changes = changes * factors
+    mean = np.average(penalized_changes, axis=-1, weights=weights_arr)
+    var = np.average((penalized_changes - mean[..., None]) ** 2, axis=-1, weights=weights_arr)
+    std_risk = np.sqrt(var)
+
+    # Normalized across tokens (last axis); NaN rows are left out
+    min_val = np.fmin.reduce(std_risk, axis=-1, keepdims=True)
+    max_val = np.fmax.reduce(std_risk, axis=-1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        risk_score = np.where(max_val != min_val, (std_risk - min_val) / (max_val - min_val), 0.0)
+    risk_score = np.where(np.isnan(std_risk), np.nan, risk_score)
+    return std_risk, risk_score
+
+
+def performance_risk_score(tokens, weights=RISK_WEIGHTS):
+    """[{symbol, std_risk, RiskScore}] for market data tokens, riskiest first.
+
+    CoinGecko reports missing changes as null; such tokens are skipped
+    rather than scored with a NaN RiskScore.
+    """
+    changes = np.array([[token.get(key) for key in RISK_HORIZONS] for token in tokens], dtype=np.float64)
+    complete = np.isfinite(changes).all(axis=-1) if len(tokens) else np.zeros(0, dtype=bool)
+    for i in np.flatnonzero(~complete):
+        logger.warning(f"Missing price changes for {tokens[i].get('id')}, skipping risk score")
+    tokens = [token for token, ok in zip(tokens, complete) if ok]
+    if not tokens:
+        return []
+    std_risk, risk_score = performance_risk_matrix(changes[complete], weights)
+    order = np.argsort(-risk_score, kind="stable")
+    return [
+        {
+            "symbol": tokens[i]["id"],
+            "std_risk": float(std_risk[i]),
+            "RiskScore": float(risk_score[i])
+        }
+        for i in order
+    ]
@@ -49,6 +49,8 @@ const MCP_SERVER_URL: string = "http://127.0.0.1:5001";
 
 const ASSET_BALANCES_ENDPOINT: string = `${MCP_SERVER_URL}/contract/asset-balances`;
 
+const HISTORY_ENDPOINT: string = `${MCP_SERVER_URL}/history/activity?limit=50`;
+
 const CG_API_KEY: string =  "CG-XftMymJT5BMWYsLNRakRyERP";
 const UNIPOOL_CONTRACT_ADDRESS: string =  "0xc79AB5D4544E50Db86061cF34908Ea42ADc2EDda";
 
@@ -248,14 +250,18 @@ const UnipoolContractUI: React.FC<UnipoolContractUIProps> = () => {
 
 
 
+// Last sequence seen per topic, sent on (re)connect so the server only replays what we missed
+const lastSeq: Record<string, number> = {};
+
 const DashboardApp: React.FC = () => {
   const [isConnected, setIsConnected] = useState(false);
-  const socket: Socket = io(MCP_SERVER_URL);
+  const socket: Socket = io(MCP_SERVER_URL, { auth: (cb) => cb({ cursors: lastSeq }) });
 
   const [researchAgent, setResearchAgent] = useState<AgentState>({ status: 'Awaiting data...', logs: [] });
   const [riskAgent, setRiskAgent] = useState<AgentState>({ status: 'Awaiting data...', logs: [] });
   const [pmAgent, setPmAgent] = useState<AgentState>({ status: 'Awaiting data...', logs: [] });
   const [traderAgent, setTraderAgent] = useState<AgentState>({ status: 'Awaiting instructions...', logs: [] });
+  const [chainHistory, setChainHistory] = useState<AgentState>({ status: 'Loading on-chain history...', logs: [] });
 
 
   const truncateEthAddress = (
@@ -285,6 +291,48 @@ const DashboardApp: React.FC = () => {
 
 
 
+  // One line per indexed Unipool event (Invest, Withdraw, AssetSwapped, Rebalanced)
+  const describeEvent = (event: any): string => {
+    const args = event.args ?? {};
+    switch (event.event) {
+      case 'Invest':
+        return `Invest: ${truncateEthAddress(args.investor)} deposited ${args.amount}`;
+      case 'Withdraw':
+        return `Withdraw: ${truncateEthAddress(args.investor)} redeemed ${args.amount} (sent ${args.sentToUser}, fee ${args.sentToTreasury})`;
+      case 'AssetSwapped':
+        return `Swap: ${args.amountIn} ${truncateEthAddress(args.fromToken)} -> ${args.amountOut} ${truncateEthAddress(args.toToken)}`;
+      case 'Rebalanced':
+        return `Rebalanced: sold ${args.sellAssets.map((address: string) => truncateEthAddress(address))}, bought ${args.buyAssets.map((address: string) => truncateEthAddress(address))}`;
+      case 'Reorg':
+        return `Chain reorg, history re-indexed from block ${event.block_number + 1}`;
+      default:
+        return event.event;
+    }
+  };
+
+  const eventLog = (event: any): AgentLog => ({
+    timestamp: event.timestamp ? new Date(event.timestamp * 1000).toLocaleString() : new Date().toLocaleTimeString(),
+    message: `#${event.block_number} ${describeEvent(event)}`,
+  });
+
+  // History comes from the agents' event index, never from scanning the chain in the browser
+  useEffect(() => {
+    fetch(HISTORY_ENDPOINT)
+      .then((res) => res.json())
+      .then((data) => {
+        if (!data.success) throw new Error(data.error || "Unknown error fetching history");
+        setChainHistory(prev => ({
+          status: `Indexed up to block ${data.checkpoint}`,
+          logs: [...prev.logs, ...data.events.map(eventLog)].slice(0, 50),
+        }));
+      })
+      .catch((err) => {
+        console.error("Failed to fetch on-chain history:", err);
+        updateStatus(setChainHistory, 'On-chain history unavailable');
+      });
+    // eslint-disable-next-line
+  }, []);
+
   useEffect(() => {
     socket.on('connect', () => {
       console.log('### Connected to server');
@@ -296,41 +344,76 @@ const DashboardApp: React.FC = () => {
       setIsConnected(false);
     });
 
-    socket.on('market_data', ({ message }: { message: any }) => {
-      console.log('market_data', message);
-      const status = `Analyzed ${message.token}: Score ${message.score}, Sentiment: ${message.sentiment}, Confidence: ${message.confidence}, Recommendation:  ${message.recommendation}, Factors:  ${message.key_factors}  `;
-      updateStatus(setResearchAgent, status);
-      addLog(setResearchAgent, status);
-    });
+    const handlers: Record<string, (message: any) => void> = {
+      market_data: (message) => {
+        console.log('market_data', message);
+        const status = `Analyzed ${message.token}: Score ${message.score}, Sentiment: ${message.sentiment}, Confidence: ${message.confidence}, Recommendation:  ${message.recommendation}, Factors:  ${message.key_factors}  `;
+        updateStatus(setResearchAgent, status);
+        addLog(setResearchAgent, status);
+      },
+
+      risk_metrics: (message) => {
+        console.log('risk_metrics', message);
+        const status = ` Token: ${message.symbol},  Risk Score: ${message.RiskScore}, std_risk: ${message.std_risk}`;
+        updateStatus(setRiskAgent, status);
+        addLog(setRiskAgent, status);
+      },
+
+      portfolio_risk: (message) => {
+        console.log('portfolio_risk', message);
+        const status = ` Portfolio (${message.samples} returns): VaR95: ${(message.var_95 * 100).toFixed(2)}%, Sharpe: ${message.sharpe_ratio.toFixed(2)}, Max drawdown: ${(message.max_drawdown * 100).toFixed(2)}%`;
+        updateStatus(setRiskAgent, status);
+        addLog(setRiskAgent, status);
+      },
+
+      risk_alert: (message) => {
+        console.log('risk_alert', message);
+        const status = `Risk Assessment: ${message.type} (severity: ${message.severity}) -  ${message.message}`;
+        updateStatus(setRiskAgent, status);
+        addLog(setRiskAgent, status);
+      },
+
+      pm_instructions: (message) => {
+        console.log('pm_instructions', message);
+        const status = `New Trade Order  :: Action -> (${message.action}),   ${ message.detail ?  "Detail: Sell assets " + message.detail.sell_assets.map((address: string) => truncateEthAddress(address)) + " :: Buy assets " + message.detail.buy_assets.map((address: string) => truncateEthAddress(address)) : "" } `;
+        updateStatus(setPmAgent, status);
+        addLog(setPmAgent, status);
+      },
+
+      trader_status: (message) => {
+        console.log('trader_status', message);
+        const status = `${message.status}:  ${message.tx_hash ? " tx_hash : " + message.tx_hash + ", " : "" }  Sell assets ${message.details.sell_assets.map((address: string) => truncateEthAddress(address))}, Buy Assets -> ${message.details.buy_assets.map((address: string) => truncateEthAddress(address))} `;
+        updateStatus(setTraderAgent, status);
+        addLog(setTraderAgent, status);
+        fetchPortfolio();
+      },
 
-    socket.on('risk_metrics', ({ message }: { message: any }) => {
-      console.log('risk_metrics', message);
-      const status = ` Token: ${message.symbol},  Risk Score: ${message.RiskScore}, std_risk: ${message.std_risk}`;
-      updateStatus(setRiskAgent, status);
-      addLog(setRiskAgent, status);
-    });
+      chain_events: (message) => {
+        console.log('chain_events', message);
+        const log = eventLog(message);
+        setChainHistory(prev => ({ status: log.message, logs: [log, ...prev.logs].slice(0, 50) }));
+      },
+    };
 
-    socket.on('risk_alert', ({ message }: { message: any }) => {
-      console.log('risk_alert', message);
-      const status = `Risk Assessment: ${message.type} (severity: ${message.severity}) -  ${message.message}`;
-      updateStatus(setRiskAgent, status);
-      addLog(setRiskAgent, status);
-    });
+    const deliver = (topic: string, seq: number, message: any) => {
+      if (seq <= (lastSeq[topic] ?? -1)) return;
+      lastSeq[topic] = seq;
+      handlers[topic]?.(message);
+    };
 
-    socket.on('pm_instructions', ({ message }: { message: any }) => {
-      console.log('pm_instructions', message);
-      const status = `New Trade Order  :: Action -> (${message.action}),   ${ message.detail ?  "Detail: Sell assets " + message.detail.sell_assets.map((address: string) => truncateEthAddress(address)) + " :: Buy assets " + message.detail.buy_assets.map((address: string) => truncateEthAddress(address)) : "" } `;
-      updateStatus(setPmAgent, status);
-      addLog(setPmAgent, status);
+    // Single messages (SOCKET_BATCH_WINDOW=0 on the server)
+    Object.keys(handlers).forEach((topic) => {
+      socket.on(topic, ({ seq, message }: { seq: number, message: any }) => deliver(topic, seq, message));
     });
 
-    socket.on('trader_status', ({ message }: { message: any }) => {
-      console.log('trader_status', message);
-      const status = `${message.status}:  ${message.tx_hash ? " tx_hash : " + message.tx_hash + ", " : "" }  Sell assets ${message.details.sell_assets.map((address: string) => truncateEthAddress(address))}, Buy Assets -> ${message.details.buy_assets.map((address: string) => truncateEthAddress(address))} `;
-      updateStatus(setTraderAgent, status);
-      addLog(setTraderAgent, status);
-      fetchPortfolio();
-    });
+    // Batched frames and the connect snapshot: { topics: { topic: [{ seq, message }, ...] } }
+    const onFrame = ({ topics }: { topics: Record<string, { seq: number, message: any }[]> }) => {
+      Object.entries(topics).forEach(([topic, entries]) => {
+        entries.forEach(({ seq, message }) => deliver(topic, seq, message));
+      });
+    };
+    socket.on('batch', onFrame);
+    socket.on('snapshot', onFrame);
     return () => {
       // socket.disconnect();
     };
@@ -362,6 +445,9 @@ const DashboardApp: React.FC = () => {
           <AgentCard name="Risk-Agent" icon={<Shield className="text-red-400" />} status={riskAgent.status} logs={riskAgent.logs} />
           <AgentCard name="PM-Agent" icon={<DollarSign className="text-yellow-400" />} status={pmAgent.status} logs={pmAgent.logs} />
           </div>
+          <div className="lg:col-span-2">
+            <AgentCard name="Unipool On-Chain History" icon={<FileText className="text-purple-400" />} status={chainHistory.status} logs={chainHistory.logs} />
+          </div>
         </main>
       </div>
     </div>